@@ -0,0 +1,163 @@
+import os
+import gc
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from search_backends import ExactSearch, available_backends, make_backend, recall_at_k
+from embedding_store import EmbeddingStore, write_store
+
+# Configuration
+DIM = 512  # ArcFace embedding size
+SIZES = [10_000, 100_000, 1_000_000]
+IMAGES_PER_IDENTITY = 10
+INTRA_CLASS_NOISE = 0.04  # per-dimension noise around each identity centre (~0.45 cosine distance within a class)
+NUM_QUERIES = 200  # single-query latency samples
+BATCH_SIZE = 256  # queries per batched call for the throughput figure
+K = 1
+STORE_DTYPES = ["float16", "int8", "pq"]  # memory-mapped EmbeddingStore variants, run as "store-<dtype>"
+RESULTS_PATH = "output/gallery_scaling.json"
+PLOT_PATH = "output/gallery_scaling.png"
+
+
+def l2_normalize(x):
+    # Local copy, so the benchmark does not import DeepFace/TensorFlow and skew the memory numbers
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-10)
+
+
+def synthetic_gallery(size, dim=DIM, per_identity=IMAGES_PER_IDENTITY, seed=0, chunk=100_000):
+    # Clustered unit vectors: identity centres plus per-image noise, built in chunks
+    rng = np.random.default_rng(seed)
+    centres = l2_normalize(rng.standard_normal((max(1, size // per_identity), dim)).astype(np.float32))
+    embeddings = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, chunk):
+        stop = min(size, start + chunk)
+        ids = np.arange(start, stop) // per_identity % len(centres)
+        noise = rng.standard_normal((stop - start, dim)).astype(np.float32) * INTRA_CLASS_NOISE
+        embeddings[start:stop] = l2_normalize(centres[ids] + noise)
+    return embeddings
+
+
+def synthetic_queries(embeddings, n, seed=1):
+    # Unseen photos of enrolled people: fresh noise around random gallery entries
+    rng = np.random.default_rng(seed)
+    picks = embeddings[rng.choice(len(embeddings), size=n, replace=False)]
+    return l2_normalize(picks + rng.standard_normal(picks.shape).astype(np.float32) * INTRA_CLASS_NOISE)
+
+
+def rss_bytes():
+    # Current resident set size (Linux); falls back to the peak from getrusage elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def benchmark_names():
+    return available_backends() + [f"store-{dtype}" for dtype in STORE_DTYPES]
+
+
+def build_store(dtype, embeddings, store_dir):
+    # Written with write_store and mapped back, exactly as the tools serve a --store
+    write_store(store_dir, embeddings, [""] * len(embeddings), [""] * len(embeddings), dtype=dtype)
+    return EmbeddingStore(store_dir)
+
+
+def bench_backend(name, embeddings, queries, batch, exact):
+    store_dir = tempfile.mkdtemp(prefix="gallery_scaling_") if name.startswith("store-") else None
+    try:
+        return _bench_backend(name, embeddings, queries, batch, exact, store_dir)
+    finally:
+        if store_dir is not None:
+            shutil.rmtree(store_dir, ignore_errors=True)
+
+
+def _bench_backend(name, embeddings, queries, batch, exact, store_dir):
+    gc.collect()
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    if store_dir is not None:
+        backend = build_store(name[len("store-"):], embeddings, store_dir)
+        build_s = time.perf_counter() - start
+        # The store replaces the float32 matrix: count its mapped codes (+ PQ codebook)
+        index_mb = backend.nbytes() / 2**20
+    else:
+        backend = make_backend(name, embeddings)
+        build_s = time.perf_counter() - start
+        # The exact backend only references the matrix, so count the matrix for every backend
+        index_mb = (rss_bytes() - rss_before + embeddings.nbytes) / 2**20
+
+    backend.search(queries[:1], K)  # warm-up
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        backend.search(query[None, :], K)
+        latencies.append(time.perf_counter() - start)
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000.0, (50, 95, 99))
+
+    start = time.perf_counter()
+    backend.search(batch, K)
+    throughput = len(batch) / (time.perf_counter() - start)
+
+    recall = recall_at_k(backend, exact, queries, K) if name != "exact" else 1.0
+    return {"backend": name, "size": len(embeddings), "build_s": round(build_s, 3),
+            "memory_mb": round(index_mb, 1), "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3), "batch_qps": round(throughput, 1), "recall": round(recall, 4)}
+
+
+def plot(rows, path):
+    import matplotlib.pyplot as plt
+    fig, axes = plt.subplots(1, 3, figsize=(16, 5))
+    for name in sorted({row["backend"] for row in rows}):
+        mine = [row for row in rows if row["backend"] == name]
+        sizes = [row["size"] for row in mine]
+        axes[0].plot(sizes, [row["p95_ms"] for row in mine], marker="o", label=name)
+        axes[1].plot(sizes, [row["batch_qps"] for row in mine], marker="o", label=name)
+        axes[2].plot(sizes, [row["memory_mb"] for row in mine], marker="o", label=name)
+    for ax, title in zip(axes, ["p95 query latency (ms)", "batch throughput (queries/s)", "memory (MB)"]):
+        ax.set_xscale("log")
+        ax.set_yscale("log")
+        ax.set_xlabel("gallery size")
+        ax.set_title(title)
+        ax.grid(True, which="both")
+        ax.legend()
+    plt.tight_layout()
+    plt.savefig(path)
+    print(f"✅ Plot saved to: {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search backend scaling on synthetic ArcFace-sized galleries")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--backends", nargs="+", default=benchmark_names(), choices=benchmark_names())
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--plot", action="store_true", help=f"also save a plot to {PLOT_PATH}")
+    args = parser.parse_args()
+
+    rows = []
+    print(f"{'backend':<13} {'size':>9} {'build s':>8} {'mem MB':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'batch q/s':>10} {'recall':>7}")
+    for size in args.sizes:
+        embeddings = synthetic_gallery(size)
+        queries = synthetic_queries(embeddings, min(args.queries, size))
+        batch = synthetic_queries(embeddings, min(BATCH_SIZE, size), seed=2)
+        exact = ExactSearch(embeddings)
+        for name in args.backends:
+            row = bench_backend(name, embeddings, queries, batch, exact)
+            rows.append(row)
+            print(f"{name:<13} {size:>9} {row['build_s']:>8.2f} {row['memory_mb']:>8.1f} {row['p50_ms']:>8.3f} "
+                  f"{row['p95_ms']:>8.3f} {row['p99_ms']:>8.3f} {row['batch_qps']:>10.1f} {row['recall']:>7.3f}")
+        del embeddings, exact
+        gc.collect()
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"dim": DIM, "k": K, "results": rows}, f, indent=2)
+    print(f"\n✅ Results saved to: {args.output}")
+    if args.plot:
+        plot(rows, PLOT_PATH)
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import cv2
+import numpy as np
+from deepface import DeepFace
+from face_gallery import FaceGallery, list_gallery_images
+from face_pipeline import align_crop, embed_faces
+from stage_metrics import StageMetrics
+from unknown_logger import UnknownLogWriter, crop_with_margin
+
+# Configuration
+KNOWN_FACES_DIR = "dataset/known_faces"
+TEST_DIR = "dataset/test_faces"
+DETECTORS = ["retinaface", "mtcnn"]
+MODELS = ["ArcFace", "VGG-Face"]
+REPEATS = 3  # passes over the dataset per configuration, after one warm-up image
+TOLERANCE = 0.10  # p50 slower than baseline by more than this fraction is a regression
+RESULTS_PATH = "output/stage_benchmark.json"
+BASELINE_PATH = "output/stage_benchmark_baseline.json"
+COMPARED_STAT = "p50_ms"
+
+
+def environment():
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "numpy": np.__version__, "opencv": cv2.__version__,
+            "deepface": getattr(sys.modules.get("deepface"), "__version__", "unknown")}
+
+
+def bench_decode(paths, metrics, repeats):
+    for _ in range(repeats):
+        for path in paths:
+            with metrics.time("decode"):
+                cv2.imread(path)
+
+
+def bench_config(frames, detector, model_name, repeats):
+    """Per-stage latencies of one detector/model pair over the decoded test frames."""
+    metrics = StageMetrics(window=1_000_000)
+    model = DeepFace.build_model(model_name)
+    gallery = FaceGallery.load_or_build(KNOWN_FACES_DIR, model_name=model_name, detector_backend=detector)
+    log_dir = tempfile.mkdtemp(prefix="stage_benchmark_")
+
+    def run_frame(frame, metrics):
+        with metrics.time("detection"):
+            detected = DeepFace.extract_faces(img_path=frame, detector_backend=detector,
+                                              enforce_detection=False, align=False)
+        areas = [face_info["facial_area"] for face_info in detected if face_info.get("confidence", 1) > 0]
+        if not areas:
+            return []
+        faces = []
+        for area in areas:
+            with metrics.time("alignment"):
+                crop = align_crop(frame, area)
+            if crop.size:
+                faces.append(crop[:, :, ::-1].astype(np.float32) / 255.0)
+        if not faces:
+            return []
+        with metrics.time("embedding"):
+            embeddings = embed_faces(faces, model)
+        with metrics.time("search"):
+            gallery.search(embeddings, k=1)
+        return [(a["x"], a["y"], a["w"], a["h"]) for a in areas]
+
+    try:
+        run_frame(frames[0], StageMetrics())  # warm-up: weights, graph tracing, detector init
+        detections = []
+        for _ in range(repeats):
+            for frame in frames:
+                detections.append((frame, run_frame(frame, metrics)))
+
+        # Unknown logging: crop + non-blocking submit on the hot path, then the
+        # writer thread's per-entry cost (JPEG encode + batched log append)
+        writer = UnknownLogWriter(log_dir, max_queue=sum(len(b) for _, b in detections) + 1, flush_interval=0.05)
+        writer.start()
+        start = time.perf_counter()
+        for frame, frame_boxes in detections:
+            for box in frame_boxes:
+                with metrics.time("unknown_submit"):
+                    writer.submit(crop_with_margin(frame, box))
+        writer.stop()
+        writer.join()
+        if writer.written:
+            metrics.record("unknown_write", (time.perf_counter() - start) / writer.written)
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+    return metrics.snapshot()["stages"]
+
+
+def compare(results, baseline, tolerance):
+    # (config, stage, baseline ms, current ms, ratio) for every stage slower than the tolerance allows
+    regressions = []
+    print(f"\n{'configuration':<24} {'stage':<16} {'baseline':>10} {'current':>10} {'change':>8}")
+    for config, stages in results["results"].items():
+        for stage, stats in stages.items():
+            before = baseline.get("results", {}).get(config, {}).get(stage, {}).get(COMPARED_STAT)
+            if not before:
+                continue
+            ratio = stats[COMPARED_STAT] / before
+            flag = "  ❌" if ratio > 1 + tolerance else ""
+            print(f"{config:<24} {stage:<16} {before:>8.2f}ms {stats[COMPARED_STAT]:>8.2f}ms "
+                  f"{(ratio - 1) * 100:>+7.1f}%{flag}")
+            if ratio > 1 + tolerance:
+                regressions.append((config, stage, before, stats[COMPARED_STAT], ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage latency benchmark on the bundled dataset")
+    parser.add_argument("--detectors", nargs="+", default=DETECTORS)
+    parser.add_argument("--models", nargs="+", default=MODELS)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N test images")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    test_paths = list_gallery_images(TEST_DIR)[:args.limit]
+    frames = [frame for frame in (cv2.imread(path) for path in test_paths) if frame is not None]
+    if not frames:
+        print("❌ No test images found.")
+        raise SystemExit(1)
+
+    results = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "environment": environment(),
+               "config": {"repeats": args.repeats, "test_images": len(frames),
+                          "detectors": args.detectors, "models": args.models},
+               "results": {}}
+
+    print(f"📐 Benchmarking stages on {len(frames)} test images x {args.repeats} repeats\n{'-'*60}")
+    decode_metrics = StageMetrics(window=1_000_000)
+    bench_decode(list_gallery_images(KNOWN_FACES_DIR) + test_paths, decode_metrics, args.repeats)
+    results["results"]["io"] = decode_metrics.snapshot()["stages"]
+
+    for detector in args.detectors:
+        for model_name in args.models:
+            config = f"{detector}/{model_name}"
+            print(f"⏱️ {config}...")
+            results["results"][config] = bench_config(frames, detector, model_name, args.repeats)
+
+    for config, stages in results["results"].items():
+        print(f"\n{config}")
+        for stage, stats in stages.items():
+            print(f"  {stage:<16} p50 {stats['p50_ms']:>8.2f}ms  p95 {stats['p95_ms']:>8.2f}ms  n={stats['count']}")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Results saved to: {args.output}")
+
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"✅ Baseline saved to: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} stage(s) regressed by more than {args.tolerance:.0%}")
+            raise SystemExit(1)
+        print(f"\n✅ No regressions beyond {args.tolerance:.0%}")
+    else:
+        print(f"ℹ️ No baseline at {args.baseline}; run with --save-baseline to create one")
@@ -0,0 +1,62 @@
+import argparse
+import time
+import numpy as np
+from face_gallery import FaceGallery, list_gallery_images, label_from_path, embed_gallery_image
+
+# Configuration
+TEST_DIR = "dataset/test_faces"
+KNOWN_FACES_DIR = "dataset/known_faces"
+MODEL_NAME = "ArcFace"
+DETECTOR = "retinaface"
+THRESHOLD = 0.55
+PROTOTYPES_TO_TEST = [1, 3, 5, 10, 20]
+METHODS = ["medoids", "centroids"]
+
+
+def embed_test_set(test_dir):
+    embeddings, labels = [], []
+    for img_path in list_gallery_images(test_dir):
+        embedding = embed_gallery_image(img_path, MODEL_NAME, DETECTOR)
+        if embedding is None:
+            print(f"⚠️ No face in {img_path}, skipped")
+            continue
+        embeddings.append(embedding)
+        labels.append(label_from_path(img_path))
+    return np.asarray(embeddings, dtype=np.float32), labels
+
+
+def evaluate(gallery, embeddings, labels):
+    start = time.perf_counter()
+    predictions = gallery.identify(embeddings, THRESHOLD)
+    search_ms = (time.perf_counter() - start) * 1000.0 / max(len(labels), 1)
+    known = set(gallery.labels)
+    # Test folders of people who are not enrolled (e.g. "Unknown") must come out as Unknown
+    expected = [label if label in known else "Unknown" for label in labels]
+    correct = sum(name == actual for (name, _), actual in zip(predictions, expected))
+    return correct / max(len(labels), 1), search_ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compress each identity into k prototypes and measure the accuracy cost")
+    parser.add_argument("--k", type=int, nargs="+", default=PROTOTYPES_TO_TEST, help="Prototypes per identity")
+    parser.add_argument("--methods", nargs="+", default=METHODS, choices=METHODS)
+    args = parser.parse_args()
+
+    print("📦 Loading gallery and embedding the test set...")
+    full = FaceGallery.load_or_build(KNOWN_FACES_DIR, model_name=MODEL_NAME, detector_backend=DETECTOR)
+    embeddings, labels = embed_test_set(TEST_DIR)
+    if not labels:
+        print("❌ No test faces found.")
+        raise SystemExit(1)
+
+    full_acc, full_ms = evaluate(full, embeddings, labels)
+    print(f"\n📐 {len(labels)} test faces, THRESHOLD = {THRESHOLD}\n{'-'*72}")
+    print(f"{'method':<10} {'k':>4} {'size':>7} {'smaller':>8} {'accuracy':>9} {'delta':>8} {'search ms':>10}")
+    print(f"{'full':<10} {'-':>4} {len(full):>7} {'1.0x':>8} {full_acc:>9.3f} {'':>8} {full_ms:>10.3f}")
+
+    for method in args.methods:
+        for k in args.k:
+            compressed = full.compress(k, method=method)
+            acc, ms = evaluate(compressed, embeddings, labels)
+            ratio = len(full) / max(len(compressed), 1)
+            print(f"{method:<10} {k:>4} {len(compressed):>7} {ratio:>7.1f}x {acc:>9.3f} {acc - full_acc:>+8.3f} {ms:>10.3f}")
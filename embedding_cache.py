@@ -0,0 +1,122 @@
+import os
+import hashlib
+import threading
+import numpy as np
+
+DEFAULT_CACHE_DIR = ".embedding_cache"
+DEFAULT_MAX_BYTES = 1 << 30  # 1 GiB
+EVICT_EVERY = 256  # puts between size checks
+NO_FACE = np.zeros((0,), dtype=np.float32)  # cached "no usable face" result
+
+
+def content_hash(img):
+    # Hash of the image content: file bytes for a path, raw buffer for an array
+    sha256 = hashlib.sha256()
+    if isinstance(img, np.ndarray):
+        sha256.update(f"{img.shape}{img.dtype}".encode("utf-8"))
+        sha256.update(np.ascontiguousarray(img).tobytes())
+    else:
+        with open(img, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def cache_key(img, model_name, detector_backend, align=True, normalization="base"):
+    settings = f"{model_name}|{detector_backend}|align={align}|norm={normalization}"
+    return hashlib.sha256(f"{content_hash(img)}|{settings}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk, content-addressed embedding cache shared by every tool.
+
+    Keys combine the image content hash with model, detector and alignment
+    settings, so renamed or copied files still hit and changed settings miss.
+    Each entry is one .npy file; reads refresh its mtime and the oldest
+    entries are evicted once the directory grows past max_bytes (LRU).
+    Writes are atomic, so several processes can share the directory.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".npy")
+
+    def get(self, key):
+        # Cached embedding, NO_FACE for a cached miss-detection, or None when not cached
+        path = self._path(key)
+        try:
+            embedding = np.load(path)
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return embedding
+
+    def put(self, key, embedding):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(embedding if embedding is not None else NO_FACE, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._puts += 1
+            check = self._puts % EVICT_EVERY == 0
+        if check:
+            self.evict()
+
+    def get_or_compute(self, img, model_name, detector_backend, compute, align=True):
+        """Cached embedding for `img`; `compute()` runs only on a miss and may return None (no face)."""
+        key = cache_key(img, model_name, detector_backend, align=align)
+        embedding = self.get(key)
+        if embedding is None:
+            embedding = compute()
+            self.put(key, embedding)
+        if embedding is None or len(embedding) == 0:
+            return None
+        return np.asarray(embedding, dtype=np.float32)
+
+    def evict(self):
+        entries, total = [], 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".npy"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+_shared_cache = None
+
+
+def shared_cache():
+    # One cache instance per process over DEFAULT_CACHE_DIR
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = EmbeddingCache()
+    return _shared_cache
@@ -0,0 +1,233 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from search_backends import top_k
+
+STORE_VERSION = 1
+STORE_DTYPES = ("float32", "float16", "int8", "pq")
+CHUNK = 65536  # rows decoded at a time, bounds the temporary float32 copy
+CURRENT_FILE = "CURRENT"  # names the version directory readers open
+
+
+def _kmeans(x, k, iterations=15, seed=0):
+    # Plain (euclidean) k-means for the product-quantization codebooks
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        d = (x ** 2).sum(1, keepdims=True) - 2 * x @ centroids.T + (centroids ** 2).sum(1)
+        assign = np.argmin(d, axis=1)
+        for c in range(k):
+            members = x[assign == c]
+            centroids[c] = members.mean(axis=0) if len(members) else x[rng.integers(len(x))]
+    return centroids.astype(np.float32)
+
+
+def train_pq(embeddings, m, train_size=65536, seed=0):
+    # m sub-quantizers with up to 256 centroids each -> one uint8 code per sub-vector
+    n, dim = embeddings.shape
+    if dim % m:
+        raise ValueError(f"PQ sub-quantizers ({m}) must divide the embedding dimension ({dim})")
+    ksub = min(256, n)
+    rng = np.random.default_rng(seed)
+    sample = embeddings[rng.choice(n, size=min(n, train_size), replace=False)]
+    sub = dim // m
+    return np.stack([_kmeans(sample[:, j * sub:(j + 1) * sub], ksub, seed=seed) for j in range(m)])
+
+
+def pq_encode(embeddings, codebook):
+    m, ksub, sub = codebook.shape
+    codes = np.empty((len(embeddings), m), dtype=np.uint8)
+    for j in range(m):
+        x = embeddings[:, j * sub:(j + 1) * sub]
+        d = -2 * x @ codebook[j].T + (codebook[j] ** 2).sum(1)
+        codes[:, j] = np.argmin(d, axis=1)
+    return codes
+
+
+def _replace_file(path, write):
+    # Write to a temp file and rename over the old one, so readers never see a half-written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _fingerprint(embeddings, labels, paths, dtype, params):
+    # Content address of a store version: same inputs -> same directory, nothing rewritten
+    sha1 = hashlib.sha1(json.dumps([STORE_VERSION, dtype, params, [str(label) for label in labels],
+                                    list(paths)]).encode("utf-8"))
+    sha1.update(np.ascontiguousarray(embeddings).tobytes())
+    return sha1.hexdigest()[:16]
+
+
+def current_version(path):
+    # Version directory CURRENT points at; without CURRENT, `path` itself is a single version
+    current = os.path.join(path, CURRENT_FILE)
+    if not os.path.exists(current):
+        return path
+    with open(current) as f:
+        return os.path.join(path, f.read().strip())
+
+
+def write_store(path, embeddings, labels, paths, dtype="float32", pq_m=128):
+    """Write L2-normalized embeddings as a memory-mappable store directory.
+
+    float16 halves and int8 quarters the float32 size; "pq" (product
+    quantization) stores pq_m bytes per embedding plus a small codebook.
+
+    Each version is written to its own subdirectory, named after its content,
+    and published by switching the CURRENT file with one os.replace. Readers
+    get the old or the new version, never a mix; mapped files are never
+    overwritten (Windows refuses that); an unchanged gallery is not rewritten.
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"Unknown store dtype: {dtype} (choose from {', '.join(STORE_DTYPES)})")
+    os.makedirs(path, exist_ok=True)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    version = f"v-{dtype}-{_fingerprint(embeddings, labels, paths, dtype, {'pq_m': pq_m} if dtype == 'pq' else {})}"
+    version_dir = os.path.join(path, version)
+
+    if not os.path.exists(os.path.join(version_dir, "meta.json")):
+        tmp_dir = os.path.join(path, f".tmp-{version}-{os.getpid()}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        _write_version(tmp_dir, embeddings, labels, paths, dtype, pq_m)
+        try:
+            os.rename(tmp_dir, version_dir)
+        except OSError:
+            # Another writer finished the same version first (or a broken leftover is in the way)
+            if not os.path.exists(os.path.join(version_dir, "meta.json")):
+                shutil.rmtree(version_dir, ignore_errors=True)
+                os.rename(tmp_dir, version_dir)
+            else:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    previous = os.path.basename(current_version(path))
+    if previous != version:
+        _replace_file(os.path.join(path, CURRENT_FILE), lambda f: f.write(version.encode("utf-8")))
+    _prune_versions(path, keep={version, previous})
+
+
+def _write_version(path, embeddings, labels, paths, dtype, pq_m):
+    meta = {"version": STORE_VERSION, "dtype": dtype, "count": len(labels),
+            "dim": int(embeddings.shape[1]) if len(labels) else 0,
+            "labels": [str(label) for label in labels], "paths": list(paths)}
+
+    if not len(labels):
+        # Empty gallery: still write every file of this dtype
+        codes = np.zeros((0, 0), dtype=np.float32)
+        if dtype == "int8":
+            np.save(os.path.join(path, "scale.npy"), np.zeros(0, dtype=np.float32))
+        elif dtype == "pq":
+            np.save(os.path.join(path, "codebook.npy"), np.zeros((0, 0, 0), dtype=np.float32))
+    elif dtype == "float32":
+        codes = embeddings
+    elif dtype == "float16":
+        codes = embeddings.astype(np.float16)
+    elif dtype == "int8":
+        # Symmetric per-dimension scalar quantization
+        scale = np.maximum(np.abs(embeddings).max(axis=0), 1e-8)
+        codes = np.clip(np.round(embeddings / scale * 127), -127, 127).astype(np.int8)
+        np.save(os.path.join(path, "scale.npy"), scale.astype(np.float32))
+    else:
+        codebook = train_pq(embeddings, pq_m)
+        codes = pq_encode(embeddings, codebook)
+        np.save(os.path.join(path, "codebook.npy"), codebook)
+
+    np.save(os.path.join(path, "codes.npy"), np.ascontiguousarray(codes))
+    # meta.json goes last: a version without it is incomplete and will not open
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def _prune_versions(path, keep):
+    # Best effort: a version still mapped somewhere may refuse deletion (Windows) - it
+    # is retried on the next write. The previous version is kept for readers that just
+    # read CURRENT and are about to open it.
+    for name in os.listdir(path):
+        if name.startswith("v-") and name not in keep:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+class EmbeddingStore:
+    """Read-only, memory-mapped view of a store written by write_store.
+
+    Codes are mapped with np.load(mmap_mode="r"), so every process that opens
+    the same store version shares one page-cached copy. Search runs on the
+    quantized codes directly (chunked), and follows the search-backend interface.
+    """
+
+    name = "store"
+
+    def __init__(self, path):
+        path = current_version(path)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported embedding store version in {path}")
+        self.path = path
+        self.dtype = meta["dtype"]
+        self.dim = meta["dim"]
+        self.labels = meta["labels"]
+        self.paths = meta["paths"]
+        self.scale = self.codebook = None
+        if not meta["count"]:
+            # Nothing to search or decode; don't depend on sidecar files
+            self.codes = np.zeros((0, self.dim), dtype=np.float32)
+            return
+        self.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")
+        if self.codes.shape[0] != meta["count"] or len(self.labels) != meta["count"]:
+            raise ValueError(f"Inconsistent embedding store in {path}: {self.codes.shape[0]} codes, "
+                             f"{meta['count']} entries")
+        if self.dtype == "int8":
+            self.scale = np.load(os.path.join(path, "scale.npy"))
+        elif self.dtype == "pq":
+            self.codebook = np.load(os.path.join(path, "codebook.npy"))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def nbytes(self):
+        return self.codes.nbytes + (self.codebook.nbytes if self.codebook is not None else 0)
+
+    def _chunk_sims(self, queries, start, stop):
+        codes = self.codes[start:stop]
+        if self.dtype == "int8":
+            # dot(q, x) ~= (q * scale / 127) . codes, no full dequantization needed
+            return (queries * (self.scale / 127.0)) @ codes.T.astype(np.float32)
+        if self.dtype == "pq":
+            # Asymmetric distance: per-query lookup table of sub-vector dot products
+            m, ksub, sub = self.codebook.shape
+            tables = np.einsum("qms,mks->qmk", queries.reshape(len(queries), m, sub), self.codebook)
+            return np.stack([tables[i][np.arange(m), codes].sum(axis=1) for i in range(len(queries))])
+        return queries @ np.asarray(codes, dtype=np.float32).T
+
+    def search(self, queries, k=1):
+        queries = np.asarray(queries, dtype=np.float32)
+        if len(self) == 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        best_idx, best_sims = None, None
+        for start in range(0, len(self), CHUNK):
+            idx, sims = top_k(self._chunk_sims(queries, start, start + CHUNK), k)
+            idx = idx + start
+            if best_idx is None:
+                best_idx, best_sims = idx, sims
+            else:
+                merged_idx = np.concatenate([best_idx, idx], axis=1)
+                merged_sims = np.concatenate([best_sims, sims], axis=1)
+                keep, best_sims = top_k(merged_sims, k)
+                best_idx = np.take_along_axis(merged_idx, keep, axis=1)
+        return best_idx, (1.0 - best_sims).astype(np.float32)
+
+    def decode(self):
+        # Approximate float32 embeddings (used for offline work like compress/recall checks)
+        if len(self) == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        if self.dtype == "int8":
+            return self.codes.astype(np.float32) * (self.scale / 127.0)
+        if self.dtype == "pq":
+            m = self.codebook.shape[0]
+            return np.concatenate([self.codebook[j][self.codes[:, j]] for j in range(m)], axis=1)
+        return np.asarray(self.codes, dtype=np.float32)
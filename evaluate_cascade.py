@@ -0,0 +1,75 @@
+import argparse
+import time
+from deepface import DeepFace
+from face_gallery import FaceGallery, list_gallery_images, label_from_path
+from face_pipeline import RecognitionEngine, CascadeEngine, detect_faces
+
+# Configuration
+TEST_DIR = "dataset/test_faces"
+KNOWN_FACES_DIR = "dataset/known_faces"
+MODEL_NAME = "ArcFace"
+FAST_MODEL_NAME = "SFace"
+DETECTOR = "retinaface"
+THRESHOLD = 0.55
+FAST_THRESHOLD = 0.593
+BANDS_TO_TEST = [0.0, 0.05, 0.1, 0.2, 0.3]
+
+
+def load_test_faces():
+    # Detect once per test image; every configuration then sees the same aligned crops
+    faces, labels = [], []
+    for img_path in list_gallery_images(TEST_DIR):
+        detected = detect_faces(img_path, DETECTOR)
+        if not detected:
+            print(f"⚠️ No face in {img_path}, skipped")
+            continue
+        faces.append(detected[0])
+        labels.append(label_from_path(img_path))
+    return faces, labels
+
+
+def run(engine, faces, labels, known):
+    start = time.perf_counter()
+    identities = engine.identify_faces(faces)
+    elapsed = time.perf_counter() - start
+    expected = [label if label in known else "Unknown" for label in labels]
+    accuracy = sum(name == actual for (name, _), actual in zip(identities, expected)) / len(labels)
+    return accuracy, len(faces) / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput, accuracy and escalation rate of the model cascade")
+    parser.add_argument("--bands", type=float, nargs="+", default=BANDS_TO_TEST)
+    args = parser.parse_args()
+
+    print(f"📦 Loading {MODEL_NAME} and {FAST_MODEL_NAME} with their galleries...")
+    model = DeepFace.build_model(MODEL_NAME)
+    fast_model = DeepFace.build_model(FAST_MODEL_NAME)
+    gallery = FaceGallery.load_or_build(KNOWN_FACES_DIR, model_name=MODEL_NAME, detector_backend=DETECTOR)
+    fast_gallery = FaceGallery.load_or_build(KNOWN_FACES_DIR, model_name=FAST_MODEL_NAME, detector_backend=DETECTOR)
+    known = set(gallery.labels)
+
+    faces, labels = load_test_faces()
+    if not faces:
+        print("❌ No test faces found.")
+        raise SystemExit(1)
+
+    print(f"\n📐 {len(faces)} test faces\n{'-'*60}")
+    print(f"{'configuration':<22} {'accuracy':>9} {'faces/s':>9} {'escalated':>10}")
+
+    baseline = RecognitionEngine(gallery, model, DETECTOR, THRESHOLD)
+    baseline.identify_faces(faces[:1])  # warm-up
+    accuracy, throughput = run(baseline, faces, labels, known)
+    print(f"{MODEL_NAME + ' only':<22} {accuracy:>9.3f} {throughput:>9.1f} {'100.0%':>10}")
+
+    fast_only = RecognitionEngine(fast_gallery, fast_model, DETECTOR, FAST_THRESHOLD)
+    fast_only.identify_faces(faces[:1])
+    accuracy, throughput = run(fast_only, faces, labels, known)
+    print(f"{FAST_MODEL_NAME + ' only':<22} {accuracy:>9.3f} {throughput:>9.1f} {'0.0%':>10}")
+
+    for band in args.bands:
+        cascade = CascadeEngine(gallery, model, DETECTOR, THRESHOLD, fast_gallery=fast_gallery,
+                                fast_model=fast_model, fast_threshold=FAST_THRESHOLD, band=band)
+        accuracy, throughput = run(cascade, faces, labels, known)
+        print(f"{f'cascade band={band}':<22} {accuracy:>9.3f} {throughput:>9.1f} "
+              f"{cascade.escalation_rate() * 100:>9.1f}%")
@@ -1,17 +1,19 @@
 import os
-import glob
+import json
+import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
-from deepface import DeepFace
 from sklearn.metrics import classification_report, confusion_matrix
 import pandas as pd
+from face_gallery import FaceGallery, list_gallery_images, label_from_path, embed_gallery_image, l2_normalize
 
 # Configuration
 TEST_DIR = "dataset/test_faces"
 KNOWN_FACES_DIR = "dataset/known_faces"
 MODEL_NAME = "ArcFace"
 DETECTOR = "retinaface"
-thresholds_to_test = [0.55]
+thresholds_to_test = [0.55]  # thresholds that also get a confusion matrix and detailed CSV
+SWEEP_THRESHOLDS = np.round(np.arange(0.0, 1.0 + 1e-9, 0.0025), 4)  # 401 thresholds for the dense sweep
 
 # Ensure output folder exists
 os.makedirs("output", exist_ok=True)
@@ -21,65 +23,115 @@ class_names = sorted(os.listdir(TEST_DIR))
 if "Unknown" not in class_names:
     class_names.append("Unknown")
 
+# Embed the gallery and every test image once; both go through the shared
+# embedding cache, so re-runs (e.g. with new thresholds) skip detection and embedding
+gallery = FaceGallery.load_or_build(KNOWN_FACES_DIR, model_name=MODEL_NAME, detector_backend=DETECTOR)
+image_paths = list_gallery_images(TEST_DIR)
+test_embeddings = {img_path: embed_gallery_image(img_path, MODEL_NAME, DETECTOR) for img_path in image_paths}
+
+# 🧮 Full test x gallery cosine distance matrix in one pass; thresholds only
+# decide whether each probe's nearest match is accepted
+y_true = np.array([label_from_path(p) for p in image_paths], dtype=object)
+has_face = np.array([test_embeddings[p] is not None for p in image_paths], dtype=bool)
+nearest_label = np.full(len(image_paths), "Unknown", dtype=object)
+nearest_distance = np.full(len(image_paths), np.inf)
+
+if has_face.any() and len(gallery):
+    queries = l2_normalize(np.stack([test_embeddings[p] for p, ok in zip(image_paths, has_face) if ok]))
+    distances = 1.0 - queries @ gallery.embeddings.T
+    best = np.argmin(distances, axis=1)
+    nearest_label[has_face] = gallery.labels[best]
+    nearest_distance[has_face] = distances[np.arange(len(best)), best]
+
+
+def predict(threshold):
+    return np.where(nearest_distance <= threshold, nearest_label, "Unknown")
+
+
+# 📈 Dense sweep with open-set metrics:
+#   DIR  - known probes accepted with the correct identity
+#   FNIR - 1 - DIR
+#   FPIR - unknown probes (identity not in the gallery) accepted as someone
+mated = np.isin(y_true, list(set(gallery.labels)))
+sweep_rows = []
+sweep_reports = {}
+for threshold in SWEEP_THRESHOLDS:
+    y_pred = predict(threshold)
+    accepted = nearest_distance <= threshold
+    dir_rate = float(np.mean(accepted[mated] & (nearest_label[mated] == y_true[mated]))) if mated.any() else 0.0
+    fpir = float(np.mean(accepted[~mated])) if (~mated).any() else 0.0
+    report = classification_report(y_true, y_pred, labels=class_names, zero_division=0, output_dict=True)
+    sweep_reports[f"{threshold:.4f}"] = report
+    sweep_rows.append({
+        "threshold": float(threshold),
+        "accuracy": float(np.mean(y_pred == y_true)),
+        "macro_f1": report["macro avg"]["f1-score"],
+        "dir": dir_rate,
+        "fnir": 1.0 - dir_rate,
+        "fpir": fpir
+    })
+
+sweep_df = pd.DataFrame(sweep_rows)
+sweep_df.to_csv("output/threshold_sweep.csv", index=False)
+with open("output/threshold_sweep_reports.json", "w") as f:
+    json.dump(sweep_reports, f)
+print(f"✅ Sweep over {len(SWEEP_THRESHOLDS)} thresholds saved to: output/threshold_sweep.csv "
+      f"(per-threshold reports in output/threshold_sweep_reports.json)")
+
+# 🎯 Recommended operating point: best open-set accuracy, ties go to the lowest FPIR
+best_row = sweep_df.sort_values(["accuracy", "fpir", "threshold"], ascending=[False, True, True]).iloc[0]
+print(f"\n🎯 Recommended THRESHOLD = {best_row['threshold']:.4f} "
+      f"(accuracy {best_row['accuracy']:.3f}, DIR {best_row['dir']:.3f}, FPIR {best_row['fpir']:.3f})")
+
+# 📉 Open-set ROC (DIR vs FPIR) and DET (FNIR vs FPIR) curves
+fig, (ax_roc, ax_det) = plt.subplots(1, 2, figsize=(13, 5.5))
+ax_roc.plot(sweep_df["fpir"], sweep_df["dir"], color='darkorange', lw=2)
+ax_roc.scatter([best_row["fpir"]], [best_row["dir"]], color='red', zorder=3,
+               label=f"recommended @ {best_row['threshold']:.3f}")
+ax_roc.set_xlim([0.0, 1.0])
+ax_roc.set_ylim([0.0, 1.05])
+ax_roc.set_xlabel("False Positive Identification Rate")
+ax_roc.set_ylabel("Detection & Identification Rate")
+ax_roc.set_title("Open-set ROC")
+ax_roc.legend(loc="lower right")
+ax_roc.grid(True)
+
+eps = 1e-4  # keep zero rates on the log axes
+ax_det.plot(sweep_df["fpir"].clip(lower=eps), sweep_df["fnir"].clip(lower=eps), color='navy', lw=2)
+ax_det.scatter([max(best_row["fpir"], eps)], [max(best_row["fnir"], eps)], color='red', zorder=3)
+ax_det.set_xscale("log")
+ax_det.set_yscale("log")
+ax_det.set_xlabel("False Positive Identification Rate")
+ax_det.set_ylabel("False Negative Identification Rate")
+ax_det.set_title("Open-set DET")
+ax_det.grid(True, which="both")
+plt.tight_layout()
+plt.savefig("output/open_set_roc_det.png")
+plt.show()
+
 for THRESHOLD in thresholds_to_test:
     print(f"\n📐 Testing with THRESHOLD = {THRESHOLD}\n{'-'*40}")
 
-    y_true = []
-    y_pred = []
+    y_pred = predict(THRESHOLD)
     detailed_results = []
-
-    image_paths = glob.glob(f"{TEST_DIR}/**/*.jpg", recursive=True) + \
-                  glob.glob(f"{TEST_DIR}/**/*.jpeg", recursive=True)
-
-    for img_path in image_paths:
-        actual_label = os.path.basename(os.path.dirname(img_path))
-        y_true.append(actual_label)
-
-        predicted_label = "Unknown"
-        match_distance = None
-
-        try:
-            result = DeepFace.find(
-                img_path=img_path,
-                db_path=KNOWN_FACES_DIR,
-                model_name=MODEL_NAME,
-                enforce_detection=False,
-                silent=True,
-                detector_backend=DETECTOR
-            )
-
-            if len(result[0]) > 0:
-                top = result[0].iloc[0]
-                predicted_label = os.path.basename(os.path.dirname(top['identity']))
-                match_distance = top['distance']
-
-                if match_distance <= THRESHOLD:
-                    y_pred.append(predicted_label)
-                else:
-                    predicted_label = "Unknown"
-                    y_pred.append("Unknown")
-            else:
-                y_pred.append("Unknown")
-
-        except Exception as e:
-            print(f"⚠️ Error with {img_path}: {e}")
-            y_pred.append("Unknown")
-
+    for img_path, actual_label, predicted_label, ok, distance in zip(image_paths, y_true, y_pred, has_face,
+                                                                     nearest_distance):
         # Log to detailed results
         detailed_results.append({
             "filename": os.path.basename(img_path),
             "actual_label": actual_label,
             "predicted_label": predicted_label,
-            "distance": match_distance,
+            "distance": float(distance) if ok and len(gallery) else None,
             "match": actual_label == predicted_label
         })
+    y_true_list, y_pred_list = list(y_true), list(y_pred)
 
     # 📊 Print classification report
     print("\n📊 Classification Report:")
-    print(classification_report(y_true, y_pred, labels=class_names, zero_division=0))
+    print(classification_report(y_true_list, y_pred_list, labels=class_names, zero_division=0))
 
     # 🧱 Confusion Matrix
-    cm = confusion_matrix(y_true, y_pred, labels=class_names)
+    cm = confusion_matrix(y_true_list, y_pred_list, labels=class_names)
     cm_df = pd.DataFrame(cm, index=class_names, columns=class_names)
 
     # 📉 Plot
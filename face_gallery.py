@@ -0,0 +1,267 @@
+import os
+import glob
+import hashlib
+import pickle
+import numpy as np
+from deepface import DeepFace
+from search_backends import ExactSearch, make_backend, recall_at_k, spherical_kmeans
+from embedding_store import EmbeddingStore, write_store
+from embedding_cache import shared_cache
+
+IMAGE_EXTENSIONS = ("jpg", "jpeg")
+INDEX_VERSION = 1
+
+
+def list_gallery_images(known_dir):
+    paths = []
+    for ext in IMAGE_EXTENSIONS:
+        paths += glob.glob(f"{known_dir}/**/*.{ext}", recursive=True)
+    return sorted(paths)
+
+
+def label_from_path(path):
+    # dataset/known_faces/<name>/<name>_<id>.jpg -> <name>
+    return os.path.basename(os.path.dirname(path))
+
+
+def default_index_path(known_dir, model_name, detector_backend):
+    # Lives next to the person folders, like DeepFace's representations_*.pkl
+    return os.path.join(known_dir, f"gallery_index_{model_name}_{detector_backend}.pkl".lower())
+
+
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def embed_gallery_image(img_path, model_name, detector_backend, cache=None):
+    # Embedding of the first detected face, or None when the image has no usable face.
+    # Goes through the shared embedding cache, so an image is only embedded once per model/detector.
+    cache = shared_cache() if cache is None else cache
+
+    def compute():
+        reps = DeepFace.represent(
+            img_path=img_path,
+            model_name=model_name,
+            detector_backend=detector_backend,
+            enforce_detection=False
+        )
+        return reps[0]["embedding"] if reps else None
+
+    try:
+        return cache.get_or_compute(img_path, model_name, detector_backend, compute)
+    except Exception as e:
+        print(f"⚠️ Skipping {img_path}: {e}")
+        return None
+
+
+def l2_normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-10)
+
+
+class FaceGallery:
+    """Resident gallery: one float32 matrix of L2-normalized embeddings plus identity labels."""
+
+    def __init__(self, embeddings, labels, paths, store=None):
+        self.labels = np.asarray(labels, dtype=object)
+        self.paths = list(paths)
+        self.update_stats = None  # set by load_or_build
+        self.fingerprint = None  # set by load_or_build: identifies the exact set of gallery images
+        self.store = store
+
+        if store is not None:
+            # Searches run on the memory-mapped (possibly quantized) codes;
+            # float embeddings are only decoded if something asks for them
+            self._embeddings = None
+            self.index = store
+            return
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings = embeddings.reshape(len(labels), -1) if len(labels) else embeddings.reshape(0, 0)
+        self._embeddings = np.ascontiguousarray(l2_normalize(embeddings))
+        self.index = ExactSearch(self._embeddings)
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            self._embeddings = np.ascontiguousarray(self.store.decode())
+        return self._embeddings
+
+    def __len__(self):
+        return len(self.labels)
+
+    @classmethod
+    def load_or_build(cls, known_dir, model_name, detector_backend, index_path=None, status_callback=None):
+        """Gallery backed by a persistent, change-aware index.
+
+        Each indexed image keeps its path, size, mtime, content hash and
+        embedding. Only new or changed files are embedded; deleted files are
+        dropped. A file whose mtime changed but whose hash did not is reused.
+        """
+        index_path = index_path or default_index_path(known_dir, model_name, detector_backend)
+        entries = load_index(index_path, model_name, detector_backend)
+
+        image_paths = list_gallery_images(known_dir)
+        updated, changed = {}, False
+        stats = {"reused": 0, "embedded": 0, "removed": 0}
+
+        for i, img_path in enumerate(image_paths):
+            key = os.path.relpath(img_path, known_dir)
+            st = os.stat(img_path)
+            entry = entries.get(key)
+
+            if entry is not None and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+                updated[key] = entry
+                stats["reused"] += 1
+                continue
+
+            content_hash = file_hash(img_path)
+            if entry is not None and entry["hash"] == content_hash:
+                entry.update(size=st.st_size, mtime=st.st_mtime)
+                updated[key] = entry
+                stats["reused"] += 1
+                changed = True
+                continue
+
+            if status_callback and stats["embedded"] % 20 == 0:
+                status_callback(f"Updating face gallery... {i}/{len(image_paths)}")
+            embedding = embed_gallery_image(img_path, model_name, detector_backend)
+            updated[key] = {
+                "path": key,
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "hash": content_hash,
+                "label": label_from_path(img_path),
+                # None = no usable face; kept so the image is not retried on every start
+                "embedding": None if embedding is None else np.asarray(embedding, dtype=np.float32),
+            }
+            stats["embedded"] += 1
+            changed = True
+
+        stats["removed"] = len(set(entries) - set(updated))
+        if changed or stats["removed"]:
+            save_index(index_path, updated, model_name, detector_backend)
+
+        gallery = cls.from_entries(updated.values(), known_dir)
+        gallery.update_stats = stats
+        gallery.fingerprint = hashlib.sha1(
+            "\n".join(f"{key}\t{entry['hash']}" for key, entry in sorted(updated.items())).encode("utf-8")
+        ).hexdigest()
+        return gallery
+
+    @classmethod
+    def from_store(cls, path):
+        store = EmbeddingStore(path)
+        return cls(None, store.labels, store.paths, store=store)
+
+    def save_store(self, path, dtype="float32", **params):
+        # See embedding_store.write_store for the dtypes ("float32", "float16", "int8", "pq")
+        write_store(path, self.embeddings, self.labels, self.paths, dtype=dtype, **params)
+
+    @classmethod
+    def from_entries(cls, entries, known_dir):
+        usable = [e for e in sorted(entries, key=lambda e: e["path"]) if e["embedding"] is not None]
+        return cls(
+            [e["embedding"] for e in usable],
+            [e["label"] for e in usable],
+            [os.path.join(known_dir, e["path"]) for e in usable]
+        )
+
+    def compress(self, k, method="medoids", iterations=10, seed=0):
+        """Gallery with at most k prototypes per identity.
+
+        "centroids" keeps the spherical k-means centres of each person's
+        embeddings; "medoids" keeps the real capture closest to each centre.
+        """
+        if method not in ("centroids", "medoids"):
+            raise ValueError(f"Unknown prototype method: {method}")
+
+        embeddings, labels, paths = [], [], []
+        for label in sorted(set(self.labels)):
+            members = np.flatnonzero(self.labels == label)
+            x = self.embeddings[members]
+            centroids, assign = spherical_kmeans(x, k, iterations, seed)
+            for c, centroid in enumerate(centroids):
+                cluster = np.flatnonzero(assign == c)
+                if not len(cluster):
+                    continue
+                if method == "centroids":
+                    embeddings.append(centroid)
+                    paths.append(f"{label}#centroid{c}")
+                else:
+                    medoid = members[cluster[np.argmax(x[cluster] @ centroid)]]
+                    embeddings.append(self.embeddings[medoid])
+                    paths.append(self.paths[medoid])
+                labels.append(label)
+        return FaceGallery(embeddings, labels, paths)
+
+    def use_backend(self, name, **params):
+        # "exact" (default), "ivf" or "hnsw"; see search_backends for the tuning knobs
+        self.index = make_backend(name, self.embeddings, **params) if len(self) else ExactSearch(self.embeddings)
+        return self
+
+    def check_recall(self, k=1, num_queries=200, noise=0.05, seed=0):
+        # Recall of the active backend against exact search, on perturbed gallery samples
+        if len(self) == 0:
+            return 1.0
+        rng = np.random.default_rng(seed)
+        queries = self.embeddings[rng.choice(len(self), size=min(num_queries, len(self)), replace=False)]
+        queries = l2_normalize(queries + rng.normal(scale=noise, size=queries.shape))
+        return recall_at_k(self.index, ExactSearch(self.embeddings), queries, k)
+
+    def search(self, queries, k=1):
+        # Cosine search of one (d,) or many (n, d) queries through the active backend.
+        # Returns (indices, distances), both shaped (n, k) and sorted by distance.
+        queries = l2_normalize(np.atleast_2d(queries))
+        n = queries.shape[0]
+        if len(self) == 0:
+            return np.zeros((n, 0), dtype=np.int64), np.zeros((n, 0), dtype=np.float32)
+        return self.index.search(queries, min(k, len(self)))
+
+    def identify(self, queries, threshold):
+        # One (name, distance) per query; name is "Unknown" above the threshold.
+        idx, distances = self.search(queries, k=1)
+        results = []
+        for row_idx, row_dist in zip(idx, distances):
+            if len(row_idx) == 0 or row_idx[0] < 0:
+                results.append(("Unknown", None))
+                continue
+            distance = float(row_dist[0])
+            name = self.labels[row_idx[0]] if distance <= threshold else "Unknown"
+            results.append((name, distance))
+        return results
+
+
+def load_index(index_path, model_name, detector_backend):
+    # {relative path: entry}; empty when missing, unreadable or built with other settings
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, "rb") as f:
+            index = pickle.load(f)
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable gallery index {index_path}: {e}")
+        return {}
+    if (index.get("version") != INDEX_VERSION or index.get("model_name") != model_name
+            or index.get("detector_backend") != detector_backend):
+        return {}
+    return {entry["path"]: entry for entry in index["entries"]}
+
+
+def save_index(index_path, entries, model_name, detector_backend):
+    index = {
+        "version": INDEX_VERSION,
+        "model_name": model_name,
+        "detector_backend": detector_backend,
+        "entries": list(entries.values()),
+    }
+    # Write-then-rename so a crash never leaves a half-written index behind
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(index, f)
+    os.replace(tmp_path, index_path)
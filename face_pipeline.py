@@ -0,0 +1,281 @@
+import cv2
+import numpy as np
+from deepface import DeepFace
+from face_tracker import box_iou
+from stage_metrics import NULL_METRICS
+
+
+def detect_faces(img, detector_backend, align=True, scale=1.0, metrics=NULL_METRICS):
+    """Run the detector once; each face comes back aligned from that pass's landmarks.
+
+    With scale < 1 the detector sees a downsampled copy of the BGR frame; boxes
+    and eye landmarks are mapped back and the face is cropped and aligned from
+    the full-resolution frame.
+    """
+    if scale >= 1.0 or not isinstance(img, np.ndarray):
+        # Alignment happens inside extract_faces here, so it is timed as detection
+        with metrics.time("detection"):
+            faces = DeepFace.extract_faces(
+                img_path=img,
+                detector_backend=detector_backend,
+                enforce_detection=False,
+                align=align
+            )
+        # With enforce_detection=False DeepFace returns the whole image with zero
+        # confidence when nothing was found - that is not a face.
+        return [face_info for face_info in faces if face_info.get("confidence", 1) > 0]
+
+    with metrics.time("detection"):
+        small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        faces = DeepFace.extract_faces(
+            img_path=small,
+            detector_backend=detector_backend,
+            enforce_detection=False,
+            align=False
+        )
+
+    results = []
+    with metrics.time("crop"):
+        for face_info in faces:
+            if face_info.get("confidence", 1) <= 0:
+                continue
+            area = rescale_area(face_info["facial_area"], 1.0 / scale, img.shape)
+            crop = align_crop(img, area) if align else crop_box(img, area)
+            if crop.size == 0:
+                continue
+            results.append({
+                "face": crop[:, :, ::-1].astype(np.float32) / 255.0,  # RGB in [0, 1], like extract_faces
+                "facial_area": area,
+                "confidence": face_info.get("confidence")
+            })
+    return results
+
+
+def rescale_area(area, factor, frame_shape):
+    frame_h, frame_w = frame_shape[:2]
+    x = int(round(area["x"] * factor))
+    y = int(round(area["y"] * factor))
+    scaled = {
+        "x": min(max(x, 0), frame_w - 1),
+        "y": min(max(y, 0), frame_h - 1),
+        "w": int(round(area["w"] * factor)),
+        "h": int(round(area["h"] * factor)),
+    }
+    for key in ("left_eye", "right_eye"):
+        if area.get(key) is not None:
+            scaled[key] = (int(round(area[key][0] * factor)), int(round(area[key][1] * factor)))
+    return scaled
+
+
+def crop_box(frame, area):
+    x, y, w, h = area["x"], area["y"], area["w"], area["h"]
+    return frame[y:y + h, x:x + w]
+
+
+def align_crop(frame, area):
+    # Rotate around the box centre so the eyes are level (same angle DeepFace
+    # uses), then cut the box out of the full-resolution frame
+    left_eye, right_eye = area.get("left_eye"), area.get("right_eye")
+    if left_eye is None or right_eye is None:
+        return crop_box(frame, area)
+
+    x, y, w, h = area["x"], area["y"], area["w"], area["h"]
+    angle = float(np.degrees(np.arctan2(left_eye[1] - right_eye[1], left_eye[0] - right_eye[0])))
+    matrix = cv2.getRotationMatrix2D((x + w / 2, y + h / 2), angle, 1.0)
+    matrix[:, 2] -= (x, y)
+    return cv2.warpAffine(frame, matrix, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_CONSTANT)
+
+
+class AdaptiveDetectionScheduler:
+    """Decides which frames get a detector pass.
+
+    The interval doubles (up to max_interval) while the detected boxes stay
+    put and drops back to min_interval as soon as faces move, appear or leave.
+    """
+
+    def __init__(self, min_interval=1, max_interval=8, motion_iou=0.7):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.motion_iou = motion_iou
+        self.interval = min_interval
+        self.frames_since_detection = None
+        self.previous_boxes = None
+
+    def should_detect(self):
+        if self.frames_since_detection is None or self.frames_since_detection + 1 >= self.interval:
+            self.frames_since_detection = 0
+            return True
+        self.frames_since_detection += 1
+        return False
+
+    def observe(self, faces):
+        boxes = [(f["facial_area"]["x"], f["facial_area"]["y"], f["facial_area"]["w"], f["facial_area"]["h"])
+                 for f in faces]
+        if self.previous_boxes is not None and self._is_stable(self.previous_boxes, boxes):
+            self.interval = min(self.interval * 2, self.max_interval)
+        else:
+            self.interval = self.min_interval
+        self.previous_boxes = boxes
+
+    def _is_stable(self, old, new):
+        if len(old) != len(new):
+            return False
+        return all(max((box_iou(box, prev) for prev in old), default=0.0) >= self.motion_iou for box in new)
+
+
+def preprocess_face(face, target_size):
+    # Same steps DeepFace.represent applies to an extracted face: RGB -> BGR,
+    # aspect-preserving resize, zero-pad to the model input, float32 in [0, 1]
+    img = face[:, :, ::-1]
+    factor = min(target_size[0] / img.shape[0], target_size[1] / img.shape[1])
+    dsize = (max(1, int(img.shape[1] * factor)), max(1, int(img.shape[0] * factor)))
+    img = cv2.resize(img, dsize)
+
+    diff_0 = target_size[0] - img.shape[0]
+    diff_1 = target_size[1] - img.shape[1]
+    img = np.pad(img, ((diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)), "constant")
+    if img.shape[0:2] != tuple(target_size):
+        img = cv2.resize(img, (target_size[1], target_size[0]))
+
+    img = img.astype(np.float32)
+    if img.max() > 1:
+        img /= 255.0
+    return img
+
+
+def is_keras_model(model):
+    inner = getattr(model, "model", None)
+    return callable(inner) and hasattr(inner, "input_shape")
+
+
+def model_input_size(model):
+    # (height, width) the wrapped model expects
+    if is_keras_model(model):
+        return tuple(model.model.input_shape[1:3])
+    # Non-Keras DeepFace clients (e.g. SFace on OpenCV) expose (width, height)
+    return (model.input_shape[1], model.input_shape[0])
+
+
+def embed_faces(faces, model):
+    """Embed a list of faces from detect_faces with one batched model call."""
+    if not faces:
+        return np.zeros((0, 0), dtype=np.float32)
+    target_size = model_input_size(model)
+    batch = np.stack([preprocess_face(face, target_size) for face in faces])
+    if is_keras_model(model):
+        return np.asarray(model.model(batch, training=False), dtype=np.float32)
+    # Models without a batch entry point go through DeepFace's forward() one by one
+    return np.asarray([model.forward(img[None, ...]) for img in batch], dtype=np.float32).reshape(len(faces), -1)
+
+
+class RecognitionEngine:
+    """Stateless recognition core (detector + embedder + gallery search), shareable between threads."""
+
+    def __init__(self, gallery, model, detector_backend, threshold, detection_scale=1.0):
+        self.gallery = gallery
+        self.model = model
+        self.detector_backend = detector_backend
+        self.threshold = threshold
+        self.detection_scale = detection_scale
+
+    def detect(self, frame, metrics=NULL_METRICS):
+        return detect_faces(frame, self.detector_backend, scale=self.detection_scale, metrics=metrics)
+
+    def identify_faces(self, faces, metrics=NULL_METRICS):
+        # All crops of a frame go through the model as one batch and through
+        # the gallery as one matrix product
+        if not faces:
+            return []
+        try:
+            with metrics.time("embedding"):
+                embeddings = embed_faces([face_info["face"] for face_info in faces], self.model)
+            with metrics.time("search"):
+                return self.gallery.identify(embeddings, self.threshold)
+        except Exception as e:
+            print(f"⚠️ Recognition error: {e}")
+            return [("Unknown", None)] * len(faces)
+
+    def recognize(self, faces, tracker=None, metrics=NULL_METRICS, frames=1):
+        boxes = [(f["facial_area"]["x"], f["facial_area"]["y"], f["facial_area"]["w"], f["facial_area"]["h"])
+                 for f in faces]
+
+        if tracker is None:
+            return [{"box": box, "name": name, "distance": distance}
+                    for box, (name, distance) in zip(boxes, self.identify_faces(faces, metrics))]
+
+        # Only new, stale, borderline or strongly moved tracks pay for an embedding
+        tracks = tracker.update(boxes, frames=frames)
+        pending = [i for i, track in enumerate(tracks) if tracker.needs_embedding(track, self.threshold)]
+        for i, identity in zip(pending, self.identify_faces([faces[i] for i in pending], metrics)):
+            tracker.set_identity(tracks[i], *identity)
+
+        return [{"box": box, "name": track.name, "distance": track.distance, "track_id": track.id}
+                for box, track in zip(boxes, tracks)]
+
+
+class CascadeEngine(RecognitionEngine):
+    """Two-stage recognition: a cheap embedder decides the clear cases, ArcFace the rest.
+
+    Every face is embedded by `fast_model` and searched in `fast_gallery`
+    (built with that model). Only faces whose fast distance falls within
+    `band` of `fast_threshold` - the ambiguous ones - are re-embedded by the
+    main model and decided against the main gallery and threshold.
+
+    Both galleries live in one `galleries` tuple, so a hot swap replaces the
+    pair with a single assignment and no batch sees a mismatched pair.
+    """
+
+    def __init__(self, gallery, model, detector_backend, threshold, fast_gallery, fast_model,
+                 fast_threshold, band, detection_scale=1.0):
+        self.galleries = (None, fast_gallery)
+        super().__init__(gallery, model, detector_backend, threshold, detection_scale=detection_scale)
+        self.fast_model = fast_model
+        self.fast_threshold = fast_threshold
+        self.band = band
+        self.faces_seen = 0
+        self.escalations = 0
+
+    @property
+    def gallery(self):
+        return self.galleries[0]
+
+    @gallery.setter
+    def gallery(self, gallery):
+        self.galleries = (gallery, self.galleries[1])
+
+    @property
+    def fast_gallery(self):
+        return self.galleries[1]
+
+    @fast_gallery.setter
+    def fast_gallery(self, fast_gallery):
+        self.galleries = (self.galleries[0], fast_gallery)
+
+    def escalation_rate(self):
+        return self.escalations / self.faces_seen if self.faces_seen else 0.0
+
+    def identify_faces(self, faces, metrics=NULL_METRICS):
+        if not faces:
+            return []
+        gallery, fast_gallery = self.galleries  # one consistent pair for the whole batch
+        try:
+            crops = [face_info["face"] for face_info in faces]
+            with metrics.time("embedding_fast"):
+                fast_embeddings = embed_faces(crops, self.fast_model)
+            with metrics.time("search_fast"):
+                identities = fast_gallery.identify(fast_embeddings, self.fast_threshold)
+
+            ambiguous = [i for i, (_, distance) in enumerate(identities)
+                         if distance is None or abs(distance - self.fast_threshold) <= self.band]
+            self.faces_seen += len(faces)
+            self.escalations += len(ambiguous)
+            if ambiguous:
+                with metrics.time("embedding"):
+                    embeddings = embed_faces([crops[i] for i in ambiguous], self.model)
+                with metrics.time("search"):
+                    for i, identity in zip(ambiguous, gallery.identify(embeddings, self.threshold)):
+                        identities[i] = identity
+            return identities
+        except Exception as e:
+            print(f"⚠️ Recognition error: {e}")
+            return [("Unknown", None)] * len(faces)
@@ -0,0 +1,110 @@
+import threading
+from itertools import count
+
+
+def box_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.name = "Unknown"
+        self.distance = None
+        self.embedded_box = None  # box at the last embedding
+        self.frames_since_embed = 0
+        self.missed = 0
+
+
+class FaceTracker:
+    """IoU tracker that carries identity and distance across frames.
+
+    A track is only re-embedded when it is new, every `reembed_every` camera
+    frames (frames the detector skipped count too, see update()),
+    when its distance sits within `confidence_band` of the threshold, or when
+    its box moved/resized so much that IoU with the box at the last embedding
+    dropped below `reembed_iou`.
+    """
+
+    def __init__(self, iou_threshold=0.3, reembed_every=15, confidence_band=0.05,
+                 reembed_iou=0.5, max_missed=5):
+        self.iou_threshold = iou_threshold
+        self.reembed_every = reembed_every
+        self.confidence_band = confidence_band
+        self.reembed_iou = reembed_iou
+        self.max_missed = max_missed
+        self.tracks = []
+        self.faces_seen = 0
+        self.embed_calls = 0
+        self._ids = count(1)
+        self._lock = threading.Lock()
+
+    def update(self, boxes, frames=1):
+        # Greedy IoU matching of this frame's boxes to live tracks; returns one track per box.
+        # `frames` is how many camera frames passed since the previous update
+        # (> 1 when detection was skipped), so re-embedding stays frame-based
+        with self._lock:
+            pairs = sorted(
+                ((box_iou(box, track.box), i, j) for i, box in enumerate(boxes) for j, track in enumerate(self.tracks)),
+                reverse=True
+            )
+            assigned = [None] * len(boxes)
+            used_tracks = set()
+            for iou, i, j in pairs:
+                if iou < self.iou_threshold:
+                    break
+                if assigned[i] is not None or j in used_tracks:
+                    continue
+                assigned[i] = self.tracks[j]
+                used_tracks.add(j)
+
+            for j, track in enumerate(self.tracks):
+                if j not in used_tracks:
+                    track.missed += 1
+
+            for i, box in enumerate(boxes):
+                track = assigned[i]
+                if track is None:
+                    track = Track(next(self._ids), box)
+                    self.tracks.append(track)
+                    assigned[i] = track
+                track.box = box
+                track.missed = 0
+                track.frames_since_embed += frames
+
+            self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+            self.faces_seen += len(boxes)
+            return assigned
+
+    def needs_embedding(self, track, threshold):
+        if track.embedded_box is None:
+            return True
+        if track.frames_since_embed >= self.reembed_every:
+            return True
+        if track.distance is None or abs(track.distance - threshold) <= self.confidence_band:
+            return True
+        return box_iou(track.box, track.embedded_box) < self.reembed_iou
+
+    def set_identity(self, track, name, distance):
+        with self._lock:
+            track.name = name
+            track.distance = distance
+            track.embedded_box = track.box
+            track.frames_since_embed = 0
+            self.embed_calls += 1
+
+    def invalidate(self):
+        # Force a fresh embedding for every live track (e.g. after a gallery swap)
+        with self._lock:
+            for track in self.tracks:
+                track.embedded_box = None
+
+    def embed_ratio(self):
+        return self.embed_calls / self.faces_seen if self.faces_seen else 0.0
@@ -0,0 +1,89 @@
+import os
+import threading
+from face_gallery import FaceGallery, IMAGE_EXTENSIONS
+
+POLL_INTERVAL = 2.0  # seconds between directory scans
+
+
+def snapshot(known_dir):
+    # {relative path: (size, mtime)} of every gallery image - cheap stat-only scan
+    state = {}
+    for root, _, files in os.walk(known_dir):
+        for name in files:
+            if name.lower().rsplit(".", 1)[-1] not in IMAGE_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue  # deleted between listing and stat
+            state[os.path.relpath(path, known_dir)] = (st.st_size, st.st_mtime)
+    return state
+
+
+class GalleryWatcher(threading.Thread):
+    """Watches dataset/known_faces and hot-swaps the engine's gallery on changes.
+
+    Changes are applied through the persistent index (FaceGallery.load_or_build),
+    so only added or modified images are embedded. The new gallery is built on
+    this thread while recognition keeps using the old one, then swapped in with
+    a single attribute assignment - for a cascade, the (gallery, fast gallery)
+    pair, both built before the swap. A reload waits until the folder has stopped
+    changing for one poll, so an ongoing capture session is picked up once.
+
+    Pass the snapshot taken before the initial gallery was loaded as
+    `baseline`, so changes made while it was being built are not missed.
+    """
+
+    def __init__(self, engine, known_dir, model_name, detector_backend, prepare=None,
+                 build_fast_gallery=None, on_swap=None, poll_interval=POLL_INTERVAL, baseline=None):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.known_dir = known_dir
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.prepare = prepare  # optional post-processing (compress, store, backend)
+        self.build_fast_gallery = build_fast_gallery  # cascade engines only
+        self.on_swap = on_swap
+        self.poll_interval = poll_interval
+        self.reloads = 0
+        self._state = snapshot(known_dir) if baseline is None else baseline
+        self._pending = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.poll_interval):
+            current = snapshot(self.known_dir)
+            if current != self._state:
+                self._state = current
+                self._pending = True  # still changing; wait for it to settle
+                continue
+            if self._pending:
+                self._pending = False
+                self.reload()
+
+    def reload(self):
+        try:
+            gallery = FaceGallery.load_or_build(self.known_dir, model_name=self.model_name,
+                                                detector_backend=self.detector_backend)
+            if self.prepare is not None:
+                gallery = self.prepare(gallery)
+            fast_gallery = self.build_fast_gallery() if self.build_fast_gallery is not None else None
+        except Exception as e:
+            print(f"⚠️ Gallery reload failed, keeping the current gallery: {e}")
+            return
+
+        # Atomic swap; in-flight searches finish on the old gallery (or pair)
+        if fast_gallery is not None:
+            self.engine.galleries = (gallery, fast_gallery)
+        else:
+            self.engine.gallery = gallery
+        self.reloads += 1
+        stats = gallery.update_stats or {}
+        print(f"🔄 Gallery reloaded: {len(gallery)} embeddings "
+              f"({stats.get('embedded', 0)} embedded, {stats.get('removed', 0)} removed)")
+        if self.on_swap is not None:
+            self.on_swap(gallery)
+
+    def stop(self):
+        self._stop_event.set()
@@ -1,82 +1,211 @@
-from deepface import DeepFace
 from sklearn.metrics import classification_report, confusion_matrix
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 import os, glob
 import sys
-
-# === Step 1: Load and sanitize label mapping from CSV ===
-csv_path = "archive/Dataset.csv"
-df = pd.read_csv(csv_path)
-df['id'] = df['id'].str.strip().str.lower()
-df['label'] = df['label'].str.strip()
-label_lookup = dict(zip(df['id'], df['label']))
-
-# === Step 2: Set paths ===
-test_dir = "archive/Faces/Faces"
-db_path = "archive/Original Images/Original Images"
-test_images = glob.glob(f"{test_dir}/*.jpg")
-
-# === Step 3: Evaluation Loop ===
-y_true = []
-y_pred = []
-
-print(f"🚀 Starting evaluation on {len(test_images)} images with VGG-Face + RetinaFace...")
-
-for i, img_path in enumerate(test_images):
-    filename = os.path.basename(img_path).lower()
-    true_label = label_lookup.get(filename, "Unknown")
-
-    short_name = filename[:40] + "..." if len(filename) > 43 else filename
-    progress_msg = f"\r🔁 [{i+1}/{len(test_images)}] Processing: {short_name:<45}"
-    sys.stdout.write(progress_msg)
-    sys.stdout.flush()
-
-
-    try:
-        result = DeepFace.find(
-            img_path=img_path,
-            db_path=db_path,
-            model_name="ArcFace",
-            detector_backend="retinaface",
-            enforce_detection=False,
-            silent=True
-        )
-
-        print(f"✅ DeepFace processed: {true_label}")
-
-
-        if len(result[0]) > 0 and result[0].iloc[0]['distance'] <= 0.55:
-            identity_path = result[0].iloc[0]['identity']
-            predicted_label = os.path.basename(os.path.dirname(identity_path))
-        else:
-            predicted_label = "Unknown"
-
-    except Exception as e:
-        predicted_label = "Unknown"
-        print(f"❌ Error processing {filename} with VGG-Face: {e}")
-
-
-    print()  # moves cursor to new line after loop ends
-
-
-    y_true.append(true_label)
-    y_pred.append(predicted_label)
-
-print("✅ Evaluation complete!")
-
-# === Step 4: Classification Report ===
-print("📋 Classification Report:")
-all_labels = sorted(list(set(y_true + y_pred)))
-print(classification_report(y_true, y_pred, labels=all_labels, zero_division=0))
-
-# === Step 5: Confusion Matrix ===
-cm = confusion_matrix(y_true, y_pred, labels=all_labels)
-plt.figure(figsize=(18, 16))
-sns.heatmap(cm, xticklabels=all_labels, yticklabels=all_labels, cmap="Blues", annot=True, fmt="d")
-plt.title("Confusion Matrix – ArcFace + RetinaFace")
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.tight_layout()
-plt.show()
+import json
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from face_gallery import FaceGallery, embed_gallery_image
+from recognition_service import SERVICE_URL, recognize_remote, service_health
+
+# Configuration
+CSV_PATH = "archive/Dataset.csv"
+TEST_DIR = "archive/Faces/Faces"
+DB_PATH = "archive/Original Images/Original Images"
+MODEL_NAME = "ArcFace"
+DETECTOR = "retinaface"
+THRESHOLD = 0.55
+CHECKPOINT_PATH = "output/identify_checkpoint.jsonl"
+NUM_WORKERS = os.cpu_count() or 1
+SHARD_SIZE = 16  # images per task; each finished shard is appended to the checkpoint
+
+_gallery = None  # per-worker copy of the gallery
+
+
+def init_worker(embeddings, labels, paths):
+    # Runs once per worker process: warm the model and keep the gallery resident
+    global _gallery
+    from deepface import DeepFace
+    DeepFace.build_model(MODEL_NAME)  # DeepFace keeps built models cached per process
+    _gallery = FaceGallery(embeddings, labels, paths)
+
+
+def identify_shard(img_paths):
+    # Nearest gallery identity and distance per image; the threshold is applied at report time
+    records = []
+    for img_path in img_paths:
+        nearest, distance = "Unknown", None
+        try:
+            embedding = embed_gallery_image(img_path, MODEL_NAME, DETECTOR)
+            if embedding is not None:
+                idx, dist = _gallery.search(embedding, k=1)
+                if len(idx[0]):
+                    nearest, distance = str(_gallery.labels[idx[0][0]]), float(dist[0][0])
+        except Exception as e:
+            print(f"❌ Error processing {os.path.basename(img_path)}: {e}")
+        records.append({"file": os.path.basename(img_path).lower(), "nearest": nearest, "distance": distance})
+    return records
+
+
+def identify_shard_remote(img_paths, url):
+    # Same records from a running recognition_service.py; it applies its own THRESHOLD,
+    # so matches beyond it come back as "Unknown" (the report rejects those anyway)
+    records = []
+    for img_path in img_paths:
+        nearest, distance = "Unknown", None
+        try:
+            faces = recognize_remote(img_path, url=url)
+            if faces:
+                nearest, distance = str(faces[0]["name"]), faces[0]["distance"]
+        except Exception as e:
+            print(f"❌ Error processing {os.path.basename(img_path)}: {e}")
+        records.append({"file": os.path.basename(img_path).lower(), "nearest": nearest, "distance": distance})
+    return records
+
+
+def checkpoint_meta(gallery_fingerprint, service=None):
+    # A changed gallery (images added, removed or replaced) invalidates earlier records
+    meta = {"meta": True, "model": MODEL_NAME, "detector": DETECTOR, "db_path": DB_PATH,
+            "gallery": gallery_fingerprint}
+    if service:
+        meta["service"] = service  # detect+align in the service differs from DeepFace.represent
+    return meta
+
+
+def load_checkpoint(path, meta):
+    # Records of an earlier (possibly interrupted) run with the same settings
+    if not os.path.exists(path):
+        return []
+    records, valid_bytes = [], 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            valid_bytes += len(line)
+    if valid_bytes < os.path.getsize(path):
+        # Torn last line from a crash: cut it off so new appends start on a clean line
+        with open(path, "r+b") as f:
+            f.truncate(valid_bytes)
+    if not records or records[0] != meta:
+        if records:
+            print(f"⚠️ {path} was written with other settings, starting over")
+        os.remove(path)
+        return []
+    return records[1:]
+
+
+def append_records(f, records):
+    for record in records:
+        f.write(json.dumps(record) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumable ArcFace identification benchmark on the archive dataset")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="1 runs in this process")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--fresh", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--service", nargs="?", const=SERVICE_URL, default=None,
+                        help=f"send images to a running recognition_service.py (default {SERVICE_URL}) "
+                             f"started with --known-dir pointing at the gallery, instead of loading the model here")
+    args = parser.parse_args()
+
+    # === Step 1: Load and sanitize label mapping from CSV ===
+    df = pd.read_csv(CSV_PATH)
+    df['id'] = df['id'].str.strip().str.lower()
+    df['label'] = df['label'].str.strip()
+    label_lookup = dict(zip(df['id'], df['label']))
+
+    # === Step 2: Gallery and pending test images ===
+    test_images = glob.glob(f"{TEST_DIR}/*.jpg")
+    # Gallery embeddings come from the persistent index / shared embedding cache
+    gallery = FaceGallery.load_or_build(DB_PATH, model_name=MODEL_NAME, detector_backend=DETECTOR)
+
+    os.makedirs(os.path.dirname(args.checkpoint) or ".", exist_ok=True)
+    if args.fresh and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    if args.service:
+        health = service_health(args.service)
+        if health is None:
+            print(f"❌ No recognition service at {args.service}")
+            sys.exit(1)
+        if (health.get("model"), health.get("detector"), health.get("gallery_size")) != \
+                (MODEL_NAME, DETECTOR, len(gallery)):
+            print(f"❌ Service at {args.service} serves another model or gallery "
+                  f"({health.get('model')}, {health.get('gallery_size')} embeddings); "
+                  f"start it with --known-dir \"{DB_PATH}\"")
+            sys.exit(1)
+    meta = checkpoint_meta(gallery.fingerprint, args.service)
+    done = {record["file"] for record in load_checkpoint(args.checkpoint, meta)}
+    pending = [p for p in test_images if os.path.basename(p).lower() not in done]
+    shards = [pending[i:i + SHARD_SIZE] for i in range(0, len(pending), SHARD_SIZE)]
+
+    # === Step 3: Evaluation, streamed to the checkpoint ===
+    print(f"🚀 Starting evaluation on {len(test_images)} images with {MODEL_NAME} + RetinaFace "
+          f"({len(done)} already in the checkpoint, {args.workers} workers"
+          f"{f' via {args.service}' if args.service else ''})...")
+
+    pool = None
+    with open(args.checkpoint, "a") as f:
+        if not os.path.getsize(args.checkpoint):
+            append_records(f, [meta])
+        completed = len(done)
+        try:
+            if args.service:
+                # Concurrent requests, so the service can coalesce them into batches
+                pool = ThreadPoolExecutor(max_workers=args.workers)
+                results = (future.result() for future in
+                           as_completed([pool.submit(identify_shard_remote, s, args.service) for s in shards]))
+            elif args.workers <= 1:
+                init_worker(gallery.embeddings, gallery.labels, gallery.paths)
+                results = (identify_shard(shard) for shard in shards)
+            else:
+                # One warm model per spawned worker; shards are claimed as workers free up
+                pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=init_worker,
+                                           initargs=(gallery.embeddings, gallery.labels, gallery.paths))
+                results = (future.result() for future in as_completed([pool.submit(identify_shard, s) for s in shards]))
+            for records in results:
+                append_records(f, records)
+                completed += len(records)
+                sys.stdout.write(f"\r🔁 [{completed}/{len(test_images)}] processed")
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            print(f"\n⏸️ Interrupted - rerun to resume from {args.checkpoint}")
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+            sys.exit(1)
+        if pool is not None:
+            pool.shutdown()
+
+    print("\n✅ Evaluation complete!")
+
+    # === Step 4: Classification Report (built from the checkpoint) ===
+    y_true = []
+    y_pred = []
+    for record in load_checkpoint(args.checkpoint, meta):
+        y_true.append(label_lookup.get(record["file"], "Unknown"))
+        accepted = record["distance"] is not None and record["distance"] <= THRESHOLD
+        y_pred.append(record["nearest"] if accepted else "Unknown")
+
+    print("📋 Classification Report:")
+    all_labels = sorted(list(set(y_true + y_pred)))
+    print(classification_report(y_true, y_pred, labels=all_labels, zero_division=0))
+
+    # === Step 5: Confusion Matrix ===
+    cm = confusion_matrix(y_true, y_pred, labels=all_labels)
+    plt.figure(figsize=(18, 16))
+    sns.heatmap(cm, xticklabels=all_labels, yticklabels=all_labels, cmap="Blues", annot=True, fmt="d")
+    plt.title("Confusion Matrix – ArcFace + RetinaFace")
+    plt.xlabel("Predicted Label")
+    plt.ylabel("True Label")
+    plt.tight_layout()
+    plt.show()
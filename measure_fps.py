@@ -0,0 +1,70 @@
+import cv2
+import os
+import time
+import tempfile
+import argparse
+from face_pipeline import detect_faces
+
+# Configuration
+DETECTOR = "retinaface"
+NUM_FRAMES = 100
+
+
+def read_frames(source, num_frames):
+    cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open source: {source}")
+
+    frames = []
+    while len(frames) < num_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def detect_via_temp_jpeg(frame):
+    # The old hot path: encode, write, decode and unlink a JPEG for every frame
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp_file:
+        temp_image_path = tmp_file.name
+        cv2.imwrite(temp_image_path, frame)
+    try:
+        return detect_faces(temp_image_path, DETECTOR)
+    finally:
+        os.remove(temp_image_path)
+
+
+def detect_in_memory(frame):
+    return detect_faces(frame, DETECTOR)
+
+
+def measure(name, detect_fn, frames):
+    detect_fn(frames[0])  # warm-up, loads the detector weights
+
+    start = time.perf_counter()
+    for frame in frames:
+        detect_fn(frame)
+    elapsed = time.perf_counter() - start
+
+    fps = len(frames) / elapsed
+    print(f"{name:<22} {len(frames)} frames in {elapsed:.2f}s -> {fps:.2f} fps")
+    return fps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Before/after fps of the live detection stage")
+    parser.add_argument("--source", default="0", help="Webcam index or video file")
+    parser.add_argument("--frames", type=int, default=NUM_FRAMES)
+    args = parser.parse_args()
+
+    frames = read_frames(args.source, args.frames)
+    if not frames:
+        print("❌ No frames read.")
+        raise SystemExit(1)
+
+    print(f"📐 Measuring detection fps on {len(frames)} frames ({DETECTOR})\n{'-'*40}")
+    before = measure("temp JPEG (before)", detect_via_temp_jpeg, frames)
+    after = measure("in-memory (after)", detect_in_memory, frames)
+    print(f"✅ Speed-up: {after / before:.2f}x")
@@ -0,0 +1,199 @@
+import argparse
+import json
+import threading
+import time
+from collections import deque
+import numpy as np
+from deepface import DeepFace
+from face_gallery import FaceGallery
+from face_pipeline import RecognitionEngine, AdaptiveDetectionScheduler
+from face_tracker import FaceTracker
+from video_pipeline import DropQueue, FrameGrabber, open_capture, is_live_source
+
+# Configuration
+KNOWN_FACES_DIR = "dataset/known_faces"
+MODEL_NAME = "ArcFace"
+DETECTOR = "retinaface"
+THRESHOLD = 0.55
+DETECTION_SCALE = 0.5
+REEMBED_EVERY = 15
+NUM_WORKERS = 2
+STATS_INTERVAL = 5.0  # seconds
+LATENCY_WINDOW = 300  # frames kept for latency percentiles
+
+
+class Stream:
+    """One camera/file/URL: its own grabber, tracker, scheduler and stats; no model of its own."""
+
+    def __init__(self, stream_id, source):
+        self.id = stream_id
+        self.source = source
+        self.frames = DropQueue(maxsize=1)
+        self.grabber = FrameGrabber(open_capture(source), self.frames, live=is_live_source(source))
+        self.tracker = FaceTracker(reembed_every=REEMBED_EVERY)
+        self.scheduler = AdaptiveDetectionScheduler()
+        self.last_detected_seq = 0
+        self.busy = False
+
+        self.started_at = None
+        self.processed = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def done(self):
+        # A worker may still be running inference on the last frame
+        return self.grabber.finished and len(self.frames) == 0 and not self.busy
+
+    def record(self, latency):
+        self.processed += 1
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def stats(self):
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        latencies = np.array(self.latencies) * 1000.0
+        return {
+            "stream": self.id,
+            "source": str(self.source),
+            "fps": round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+            "processed": self.processed,
+            "dropped": self.frames.dropped,
+            "latency_ms_p50": round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+            "latency_ms_p95": round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+        }
+
+
+class MultiStreamServer:
+    """Schedules frames from all streams onto one pool of inference workers sharing one engine.
+
+    A stream is handed to at most one worker at a time (its tracker is
+    sequential state) and streams are served round-robin so one busy camera
+    cannot starve the others.
+    """
+
+    def __init__(self, sources, engine, num_workers=NUM_WORKERS, result_sink=None):
+        self.engine = engine
+        self.streams = [Stream(i, source) for i, source in enumerate(sources)]
+        self.num_workers = num_workers
+        self.result_sink = result_sink
+        self.running = False
+        self._next = 0
+        self._cond = threading.Condition()
+        self._workers = []
+
+    def _claim_stream(self):
+        # Round-robin pick of an idle stream with a pending frame
+        with self._cond:
+            for offset in range(len(self.streams)):
+                stream = self.streams[(self._next + offset) % len(self.streams)]
+                if not stream.busy and len(stream.frames):
+                    stream.busy = True
+                    self._next = (stream.id + 1) % len(self.streams)
+                    return stream
+            return None
+
+    def _release_stream(self, stream):
+        with self._cond:
+            stream.busy = False
+
+    def _worker_loop(self):
+        while self.running:
+            stream = self._claim_stream()
+            if stream is None:
+                time.sleep(0.002)
+                continue
+            try:
+                item = stream.frames.get_nowait()
+                if item is None:
+                    continue
+                if not stream.scheduler.should_detect():
+                    # Stable scene: the frame is handled, its faces keep the tracked labels
+                    stream.record(None)
+                    continue
+                faces = self.engine.detect(item["frame"])
+                stream.scheduler.observe(faces)
+                # Re-embedding counts camera frames, not detector passes
+                frames = max(1, item["seq"] - stream.last_detected_seq)
+                stream.last_detected_seq = item["seq"]
+                results = self.engine.recognize(faces, tracker=stream.tracker, frames=frames)
+                stream.record(time.time() - item["captured_at"])
+                if self.result_sink is not None:
+                    self.result_sink(stream, item, results)
+            except Exception as e:
+                print(f"⚠️ Stream {stream.id} error: {e}")
+            finally:
+                self._release_stream(stream)
+
+    def start(self):
+        self.running = True
+        for stream in self.streams:
+            stream.started_at = time.time()
+            stream.grabber.start()
+        for _ in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        self.running = False
+        for stream in self.streams:
+            stream.grabber.stop()
+        for worker in self._workers:
+            worker.join(timeout=2)
+
+    def finished(self):
+        # Under the claim lock, so a frame can't be between the queue and `busy`
+        with self._cond:
+            return all(stream.done() for stream in self.streams)
+
+    def stats(self):
+        return [stream.stats() for stream in self.streams]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless recognition over several cameras, files or stream URLs")
+    parser.add_argument("sources", nargs="+", help="Webcam indices, video files or rtsp:// URLs")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="Shared inference workers")
+    parser.add_argument("--results", help="Append per-frame results as JSON lines to this file")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL)
+    parser.add_argument("--store", help="Serve the gallery from a memory-mapped embedding store directory")
+    args = parser.parse_args()
+
+    print(f"📦 Loading {MODEL_NAME} and building the gallery once for {len(args.sources)} streams...")
+    model = DeepFace.build_model(MODEL_NAME)
+    if args.store:
+        gallery = FaceGallery.from_store(args.store)
+    else:
+        gallery = FaceGallery.load_or_build(KNOWN_FACES_DIR, model_name=MODEL_NAME, detector_backend=DETECTOR)
+    engine = RecognitionEngine(gallery, model, DETECTOR, THRESHOLD, detection_scale=DETECTION_SCALE)
+
+    results_file = open(args.results, "a") if args.results else None
+    results_lock = threading.Lock()
+
+    def write_results(stream, item, results):
+        if results_file is None:
+            return
+        record = {"stream": stream.id, "seq": item["seq"], "captured_at": item["captured_at"],
+                  "faces": [{"box": list(r["box"]), "name": str(r["name"]), "distance": r["distance"],
+                             "track_id": r.get("track_id")} for r in results]}
+        with results_lock:
+            results_file.write(json.dumps(record) + "\n")
+
+    server = MultiStreamServer(args.sources, engine, num_workers=args.workers, result_sink=write_results)
+    server.start()
+    print(f"🚀 Serving {len(server.streams)} streams with {args.workers} workers (Ctrl-C to stop)")
+
+    try:
+        while not server.finished():
+            time.sleep(args.stats_interval)
+            for stats in server.stats():
+                print(json.dumps(stats))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        if results_file is not None:
+            results_file.close()
+
+    print("📋 Final per-stream stats:")
+    for stats in server.stats():
+        print(json.dumps(stats))
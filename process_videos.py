@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+from face_gallery import FaceGallery
+from face_pipeline import RecognitionEngine
+from face_tracker import FaceTracker
+
+# Configuration
+KNOWN_FACES_DIR = "dataset/known_faces"
+MODEL_NAME = "ArcFace"
+DETECTOR = "retinaface"
+THRESHOLD = 0.55
+DETECTION_SCALE = 0.5
+REEMBED_EVERY = 15  # video frames between re-recognitions of a tracked face
+FRAME_STRIDE = 5  # process every Nth frame
+SEGMENT_SECONDS = 60.0  # video length handed to one worker task
+NUM_WORKERS = os.cpu_count() or 1
+EVENTS_PATH = "output/video_events.jsonl"
+
+_engine = None  # per-worker recognition engine
+
+
+def plan_segments(video_path, segment_seconds=SEGMENT_SECONDS):
+    # Fixed-length [start, end) frame ranges; the last one reads to EOF since frame counts can be off
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    length = max(1, int(segment_seconds * fps))
+    starts = list(range(0, max(frame_count, 1), length))
+    return [{"video": video_path, "fps": fps, "start": start,
+             "end": starts[i + 1] if i + 1 < len(starts) else None}
+            for i, start in enumerate(starts)]
+
+
+def init_worker(store_path=None):
+    # Runs once per worker process: model and gallery stay warm for every segment
+    global _engine
+    from deepface import DeepFace
+    model = DeepFace.build_model(MODEL_NAME)
+    if store_path:
+        gallery = FaceGallery.from_store(store_path)
+    else:
+        gallery = FaceGallery.load_or_build(KNOWN_FACES_DIR, model_name=MODEL_NAME, detector_backend=DETECTOR)
+    _engine = RecognitionEngine(gallery, model, DETECTOR, THRESHOLD, detection_scale=DETECTION_SCALE)
+
+
+def process_segment(segment, stride=FRAME_STRIDE):
+    """Recognition events for one segment; only frames with index % stride == 0 are decoded."""
+    cap = cv2.VideoCapture(segment["video"])
+    cap.set(cv2.CAP_PROP_POS_FRAMES, segment["start"])
+    tracker = FaceTracker(reembed_every=REEMBED_EVERY)
+    events, sampled = [], 0
+    frame_idx = segment["start"]
+
+    while segment["end"] is None or frame_idx < segment["end"]:
+        if frame_idx % stride:
+            # Skipped frames are only demuxed, not decoded
+            if not cap.grab():
+                break
+            frame_idx += 1
+            continue
+        ret, frame = cap.read()
+        if not ret:
+            break
+        sampled += 1
+        faces = _engine.detect(frame)
+        for face in _engine.recognize(faces, tracker=tracker, frames=stride):
+            events.append({
+                "video": segment["video"],
+                "timestamp": round(frame_idx / segment["fps"], 3),
+                "frame": frame_idx,
+                "box": [int(v) for v in face["box"]],
+                "identity": str(face["name"]),
+                "distance": None if face["distance"] is None else round(float(face["distance"]), 4),
+                "track_id": f"{segment['start']}-{face['track_id']}"  # tracks are per segment
+            })
+        frame_idx += 1
+
+    cap.release()
+    return events, frame_idx - segment["start"], sampled
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline recognition over video files, split into parallel segments")
+    parser.add_argument("videos", nargs="+", help="Video files")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--stride", type=int, default=FRAME_STRIDE, help="Process every Nth frame")
+    parser.add_argument("--segment-seconds", type=float, default=SEGMENT_SECONDS)
+    parser.add_argument("--output", default=EVENTS_PATH, help="JSONL file of recognition events")
+    parser.add_argument("--store", help="Serve the gallery from a memory-mapped embedding store directory")
+    args = parser.parse_args()
+
+    segments = [segment for video in args.videos for segment in plan_segments(video, args.segment_seconds)]
+    if not args.store:
+        # Build/refresh the persistent index once here, so workers only load it
+        FaceGallery.load_or_build(KNOWN_FACES_DIR, model_name=MODEL_NAME, detector_backend=DETECTOR)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    print(f"🚀 Processing {len(args.videos)} video(s) as {len(segments)} segments with {args.workers} workers "
+          f"(stride {args.stride})...")
+
+    start_time = time.time()
+    total_frames = total_sampled = total_events = 0
+    video_seconds = 0.0
+    finished, next_to_write, done = {}, 0, 0
+    with open(args.output, "w") as f, \
+            ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                                initializer=init_worker, initargs=(args.store,)) as pool:
+        futures = {pool.submit(process_segment, segment, args.stride): i for i, segment in enumerate(segments)}
+        for future in as_completed(futures):
+            i = futures[future]
+            events, frames, sampled = future.result()
+            finished[i] = events
+            total_frames += frames
+            total_sampled += sampled
+            video_seconds += frames / segments[i]["fps"]
+
+            # Write segments in order as soon as all earlier ones are done, so the stream stays sorted
+            while next_to_write in finished:
+                for event in finished.pop(next_to_write):
+                    f.write(json.dumps(event) + "\n")
+                    total_events += 1
+                f.flush()
+                next_to_write += 1
+            done += 1
+            print(f"🔁 [{done}/{len(segments)}] segments done")
+
+    elapsed = time.time() - start_time
+    print(f"\n✅ {total_events} events from {total_sampled}/{total_frames} frames saved to: {args.output}")
+    print(f"🕒 {video_seconds:.0f}s of video in {elapsed:.1f}s -> {video_seconds / max(elapsed, 1e-9):.1f}x real time")
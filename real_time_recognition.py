@@ -2,23 +2,117 @@ import customtkinter as ctk
 from PIL import Image, ImageTk
 import numpy as np
 import cv2
-import os
-import glob
-import tempfile
 import threading
 import time
 from deepface import DeepFace
+from face_gallery import FaceGallery
+from face_pipeline import RecognitionEngine, CascadeEngine, AdaptiveDetectionScheduler
+from face_tracker import FaceTracker
+from gallery_watcher import GalleryWatcher, snapshot
+from stage_metrics import StageMetrics, JsonMetricsDumper, serve_metrics
+from unknown_logger import UnknownLogWriter, crop_with_margin
+from video_pipeline import RecognitionPipeline, DROP_OLDEST, open_capture, is_live_source
 
 # Configuration
 KNOWN_FACES_DIR = "dataset/known_faces"
+VIDEO_SOURCE = "0"  # webcam index, video file or stream URL
 MODEL_NAME = "ArcFace"
 DETECTOR = "retinaface"
 THRESHOLD = 0.55
 UNKNOWN_LOG_DIR = "unknown_logs"
+QUEUE_SIZE = 2  # max items waiting between pipeline stages
+DROP_POLICY = DROP_OLDEST  # or DROP_NEWEST
+RENDER_INTERVAL_MS = 15
+REEMBED_EVERY = 15  # frames between re-recognitions of a tracked face
+DETECTION_SCALE = 0.5  # detector runs on a downsampled copy; 1.0 = full resolution
+ADAPTIVE_DETECTION = True  # detect less often while the scene is stable
+MAX_DETECTION_INTERVAL = 8  # frames
+SHOW_METRICS_OVERLAY = False  # per-stage p50/p95/p99 and fps drawn on the video
+METRICS_PORT = 9108  # Prometheus text at http://127.0.0.1:9108/metrics; None disables
+METRICS_JSON_PATH = None  # e.g. "output/live_metrics.jsonl" for periodic JSON dumps
+METRICS_DUMP_INTERVAL = 10.0  # seconds
+GALLERY_PROTOTYPES = None  # e.g. 10 to search 10 medoids per person instead of every capture
+GALLERY_STORE_DTYPE = None  # "float16", "int8" or "pq" to serve from a memory-mapped quantized store
+GALLERY_STORE_DIR = "gallery_store"
+SEARCH_BACKEND = "exact"  # "ivf" or "hnsw" for large galleries
+SEARCH_PARAMS = {}  # e.g. {"nprobe": 8} for ivf, {"ef": 64} for hnsw
+CASCADE = False  # cheap first-stage model, ArcFace only for ambiguous faces
+FAST_MODEL_NAME = "SFace"
+FAST_THRESHOLD = 0.593  # DeepFace's cosine threshold for SFace
+CASCADE_BAND = 0.1  # fast distances within this of FAST_THRESHOLD escalate to ArcFace
+
+
+# Headless pieces of the live loop, shared with replay_pipeline.py
+
+def prepare_gallery(gallery):
+    stats = gallery.update_stats
+
+    if GALLERY_PROTOTYPES:
+        gallery = gallery.compress(GALLERY_PROTOTYPES)
+
+    if GALLERY_STORE_DTYPE:
+        # Publishes a new store version only when the gallery changed; other
+        # processes mapping the store keep their version until they reopen
+        gallery.save_store(GALLERY_STORE_DIR, dtype=GALLERY_STORE_DTYPE)
+        gallery = FaceGallery.from_store(GALLERY_STORE_DIR)
+
+    if SEARCH_BACKEND != "exact" and len(gallery):
+        gallery.use_backend(SEARCH_BACKEND, **SEARCH_PARAMS)
+        print(f"Search backend {SEARCH_BACKEND}: recall@1 vs exact = {gallery.check_recall():.3f}")
+
+    gallery.update_stats = stats
+    return gallery
+
+
+def build_fast_gallery():
+    return FaceGallery.load_or_build(KNOWN_FACES_DIR, model_name=FAST_MODEL_NAME, detector_backend=DETECTOR)
+
+
+def create_engine(model, gallery):
+    if CASCADE:
+        return CascadeEngine(gallery, model, DETECTOR, THRESHOLD,
+                             fast_gallery=build_fast_gallery(),
+                             fast_model=DeepFace.build_model(FAST_MODEL_NAME),
+                             fast_threshold=FAST_THRESHOLD, band=CASCADE_BAND,
+                             detection_scale=DETECTION_SCALE)
+    return RecognitionEngine(gallery, model, DETECTOR, THRESHOLD, detection_scale=DETECTION_SCALE)
+
+
+def create_pipeline(cap, engine, metrics, live=True, lossless=False, adaptive=ADAPTIVE_DETECTION,
+                    emit_skipped=False):
+    # capture -> detect -> recognize run on their own threads; rendering
+    # stays with the consumer and never waits for recognition.
+    # Tracked faces keep their identity and are only re-embedded every
+    # REEMBED_EVERY frames, when borderline, or after a large box change
+    tracker = FaceTracker(reembed_every=REEMBED_EVERY)
+    scheduler = AdaptiveDetectionScheduler(max_interval=MAX_DETECTION_INTERVAL) if adaptive else None
+    pipeline = RecognitionPipeline(cap, engine, queue_size=QUEUE_SIZE, drop_policy=DROP_POLICY,
+                                   tracker=tracker, scheduler=scheduler, metrics=metrics,
+                                   live=live, lossless=lossless, emit_skipped=emit_skipped)
+    return pipeline, tracker
+
+
+def draw_results(display_frame, results):
+    for face in results:
+        x, y, w, h = face["box"]
+        person_name, distance = face["name"], face["distance"]
+
+        # Draw label on the frame
+        color = (0, 255, 0) if person_name != "Unknown" else (0, 0, 255)
+        cv2.rectangle(display_frame, (x, y), (x + w, y + h), color, 2)
+        label = f"{person_name}" + (f" ({distance:.2f})" if distance is not None else "")
+        cv2.putText(display_frame, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
+
+
+def log_unknowns(unknown_logger, frame, results):
+    # Hand crops of newly seen unknown tracks to the background writer
+    for face in results:
+        if face["name"] != "Unknown" or not unknown_logger.should_log(face.get("track_id")):
+            continue
+        distance = None if face["distance"] is None else round(face["distance"], 2)
+        unknown_logger.submit(crop_with_margin(frame, face["box"]), face.get("track_id"),
+                              {"distance": distance})
 
-# GUI appearance
-ctk.set_appearance_mode("dark")
-ctk.set_default_color_theme("blue")
 
 class FaceRecognitionApp(ctk.CTk):
     def __init__(self):
@@ -28,9 +122,29 @@ class FaceRecognitionApp(ctk.CTk):
         self.resizable(False, False)
 
         self.model = None
+        self.gallery = None
+        self.engine = None
+        self.pipeline = None
+        self.tracker = None
+        self.gallery_watcher = None
         self.running = False
         self.cap = None
-        self.last_unknown_log_time = 0  # prevent spam logging
+        self.last_results = []
+        self.last_result_seq = 0
+        self.unknown_logger = UnknownLogWriter(UNKNOWN_LOG_DIR)
+        self.unknown_logger.start()
+
+        self.metrics = StageMetrics()
+        self.metrics_server = None
+        if METRICS_PORT:
+            try:
+                self.metrics_server = serve_metrics(self.metrics, METRICS_PORT)
+            except OSError as e:
+                print(f"⚠️ Metrics endpoint disabled: {e}")
+        self.metrics_dumper = None
+        if METRICS_JSON_PATH:
+            self.metrics_dumper = JsonMetricsDumper(self.metrics, METRICS_JSON_PATH, METRICS_DUMP_INTERVAL)
+            self.metrics_dumper.start()
 
         self.status_text = ctk.CTkLabel(self, text="Initializing...", font=("Arial", 18))
         self.status_text.pack(pady=10)
@@ -52,22 +166,34 @@ class FaceRecognitionApp(ctk.CTk):
             self.model = DeepFace.build_model(MODEL_NAME)
             self.update_status("Model loaded.")
 
-            image_candidates = glob.glob(f"{KNOWN_FACES_DIR}/**/*.jpg", recursive=True) + \
-                               glob.glob(f"{KNOWN_FACES_DIR}/**/*.jpeg", recursive=True)
+            self.update_status("Building face gallery...")
+            # Taken first: anything changed while the gallery/engine are built is reloaded
+            dataset_state = snapshot(KNOWN_FACES_DIR)
+            self.gallery = FaceGallery.load_or_build(
+                KNOWN_FACES_DIR,
+                model_name=MODEL_NAME,
+                detector_backend=DETECTOR,
+                status_callback=self.update_status
+            )
+
+            stats = self.gallery.update_stats
+            print(f"Gallery: {stats['reused']} cached, {stats['embedded']} embedded, {stats['removed']} removed")
 
-            if not image_candidates:
+            if len(self.gallery) == 0:
                 self.update_status("No known faces found.")
                 return
 
-            self.update_status("Warming up embedding cache...")
-            DeepFace.find(
-                img_path=image_candidates[0],
-                db_path=KNOWN_FACES_DIR,
-                model_name=MODEL_NAME,
-                enforce_detection=False,
-                silent=True,
-                detector_backend=DETECTOR
-            )
+            self.gallery = prepare_gallery(self.gallery)
+            if CASCADE:
+                self.update_status(f"Building {FAST_MODEL_NAME} gallery for the cascade...")
+            self.engine = create_engine(self.model, self.gallery)
+
+            # Deletions/re-captures from the dataset manager are applied live
+            self.gallery_watcher = GalleryWatcher(self.engine, KNOWN_FACES_DIR, MODEL_NAME, DETECTOR,
+                                                  prepare=prepare_gallery,
+                                                  build_fast_gallery=build_fast_gallery if CASCADE else None,
+                                                  on_swap=self.on_gallery_swap, baseline=dataset_state)
+            self.gallery_watcher.start()
 
             self.update_status("Ready. Starting camera...")
             time.sleep(1)
@@ -77,102 +203,77 @@ class FaceRecognitionApp(ctk.CTk):
         except Exception as e:
             self.update_status(f"Error: {e}")
 
+    def on_gallery_swap(self, gallery):
+        self.gallery = gallery
+        # Make every live track re-recognize against the new gallery
+        if self.tracker is not None:
+            self.tracker.invalidate()
+
     def start_video_loop(self):
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
-            self.update_status("Failed to open webcam.")
+        try:
+            self.cap = open_capture(VIDEO_SOURCE)
+        except RuntimeError:
+            self.update_status("Failed to open video source.")
             return
 
-        while self.running:
-            ret, frame = self.cap.read()
-            if not ret:
-                continue
+        # Rendering stays on the Tk main thread (render_loop)
+        self.pipeline, self.tracker = create_pipeline(self.cap, self.engine, self.metrics,
+                                                      live=is_live_source(VIDEO_SOURCE))
+        self.pipeline.start()
+        self.after(0, self.render_loop)
+
+    def render_loop(self):
+        if not self.running:
+            return
 
-            display_frame = frame.copy()
+        result = self.pipeline.results.get_nowait()
+        new_result = result is not None and result["seq"] > self.last_result_seq
+        if new_result:
+            self.last_result_seq = result["seq"]
+            self.last_results = result["results"]
 
-            # Save frame temporarily
-            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp_file:
-                temp_image_path = tmp_file.name
-                cv2.imwrite(temp_image_path, frame)
+        frame = self.pipeline.latest_frame()
+        if frame is not None:
+            with self.metrics.time("drawing"):
+                display_frame = frame.copy()
+                draw_results(display_frame, self.last_results)
+                if SHOW_METRICS_OVERLAY:
+                    self.metrics.draw_overlay(display_frame)
 
-            try:
-                faces = DeepFace.extract_faces(
-                    img_path=temp_image_path,
-                    detector_backend=DETECTOR,
-                    enforce_detection=False,
-                    align=False
-                )
-            finally:
-                os.remove(temp_image_path)
-
-            for face_info in faces:
-                area = face_info["facial_area"]
-                x, y, w, h = area["x"], area["y"], area["w"], area["h"]
-                face_crop = frame[y:y+h, x:x+w]
-
-                try:
-                    result = DeepFace.find(
-                        img_path=face_crop,
-                        db_path=KNOWN_FACES_DIR,
-                        model_name=MODEL_NAME,
-                        enforce_detection=False,
-                        silent=True,
-                        detector_backend=DETECTOR
-                    )
-
-                    if len(result[0]) > 0:
-                        top_result = result[0].iloc[0]
-                        distance = top_result['distance']
-                        if distance <= THRESHOLD:
-                            identity_path = top_result['identity']
-                            person_name = os.path.basename(os.path.dirname(identity_path))
-                        else:
-                            person_name = "Unknown"
-                    else:
-                        person_name = "Unknown"
-
-                except:
-                    person_name = "Unknown"
-                    distance = None
-
-                # Draw label on the frame
-                color = (0, 255, 0) if person_name != "Unknown" else (0, 0, 255)
-                cv2.rectangle(display_frame, (x, y), (x + w, y + h), color, 2)
-                label = f"{person_name}" + (f" ({distance:.2f})" if distance is not None else "")
-                cv2.putText(display_frame, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
-
-                # Save unknown image with annotations
-                if person_name == "Unknown":
-                    now = time.time()
-                    if now - self.last_unknown_log_time > 3:
-                        self.last_unknown_log_time = now
-
-                        os.makedirs(UNKNOWN_LOG_DIR, exist_ok=True)
-                        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
-                        image_path = os.path.join(UNKNOWN_LOG_DIR, f"unknown_{timestamp}.jpg")
-                        log_path = os.path.join(UNKNOWN_LOG_DIR, "unknown_log.txt")
-
-                        # Save the current frame with bounding boxes
-                        cv2.imwrite(image_path, display_frame)
-                        with open(log_path, "a") as f:
-                            f.write(f"{timestamp} - Unknown detected - saved to {image_path}\n")
-
-            frame_rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            img_pil = Image.fromarray(frame_rgb)
-            img_tk = ImageTk.PhotoImage(img_pil)
-
-            self.video_panel.configure(image=img_tk)
-            self.video_panel.image = img_tk
-            self.update()
-
-        self.cap.release()
+            if new_result:
+                with self.metrics.time("logging"):
+                    log_unknowns(self.unknown_logger, result["frame"], self.last_results)
+
+            with self.metrics.time("render"):
+                frame_rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
+                img_pil = Image.fromarray(frame_rgb)
+                img_tk = ImageTk.PhotoImage(img_pil)
+
+                self.video_panel.configure(image=img_tk)
+                self.video_panel.image = img_tk
+            self.metrics.tick("rendered")
+
+        self.after(RENDER_INTERVAL_MS, self.render_loop)
 
     def on_close(self):
         self.running = False
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        self.unknown_logger.stop()
+        if self.gallery_watcher is not None:
+            self.gallery_watcher.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+        if self.metrics_dumper is not None:
+            self.metrics_dumper.stop()
         self.destroy()
 
 
 if __name__ == "__main__":
+    # GUI appearance
+    ctk.set_appearance_mode("dark")
+    ctk.set_default_color_theme("blue")
+
     app = FaceRecognitionApp()
     app.protocol("WM_DELETE_WINDOW", app.on_close)
     app.mainloop()
@@ -0,0 +1,227 @@
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue, Empty
+from urllib.parse import urlparse, parse_qs
+import cv2
+import numpy as np
+
+# Configuration
+KNOWN_FACES_DIR = "dataset/known_faces"
+MODEL_NAME = "ArcFace"
+DETECTOR = "retinaface"
+THRESHOLD = 0.55
+HOST = "127.0.0.1"
+PORT = 8765
+BATCH_WINDOW_MS = 10  # how long the batcher waits for more requests to coalesce
+MAX_BATCH = 32  # faces per model call
+SERVICE_URL = f"http://{HOST}:{PORT}"
+
+
+class DynamicBatcher:
+    """Runs the whole recognition core for concurrent requests on one thread.
+
+    The first pending request opens a window of `window_ms`; everything that
+    arrives in it (up to `max_batch` faces) is handled together: images are
+    run through the detector one after another (never concurrently on the
+    shared model), then all faces go through one batched embedding + search.
+    """
+
+    def __init__(self, engine, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH):
+        self.engine = engine
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.batches = 0
+        self.faces = 0
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, image=None, faces=None):
+        # Either a full image (detected on the batcher thread) or ready faces;
+        # the future resolves to (faces, identities)
+        future = Future()
+        if image is None and not faces:
+            future.set_result(([], []))
+        else:
+            self._queue.put((image, faces, future))
+        return future
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            count = len(pending[0][1] or [None])
+            deadline = time.perf_counter() + self.window
+            while count < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except Empty:
+                    break
+                pending.append(item)
+                count += len(item[1] or [None])  # an undetected image counts as one face
+
+            ready = []
+            for image, faces, future in pending:
+                if faces is None:
+                    try:
+                        faces = self.engine.detect(image)
+                    except Exception as e:
+                        future.set_exception(e)
+                        continue
+                ready.append((faces, future))
+
+            all_faces = [face for faces, _ in ready for face in faces]
+            try:
+                identities = self.engine.identify_faces(all_faces)
+            except Exception as e:
+                for _, future in ready:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.faces += len(all_faces)
+            start = 0
+            for faces, future in ready:
+                future.set_result((faces, identities[start:start + len(faces)]))
+                start += len(faces)
+
+
+def decode_image(data):
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return img
+
+
+def crop_to_face(img):
+    # An already aligned BGR crop in the same format detect_faces returns
+    return {
+        "face": img[:, :, ::-1].astype(np.float32) / 255.0,
+        "facial_area": {"x": 0, "y": 0, "w": img.shape[1], "h": img.shape[0]},
+    }
+
+
+class RecognitionHandler(BaseHTTPRequestHandler):
+    # POST /recognize          body = encoded image; detects, embeds and searches
+    # POST /recognize?crop=1   body = an aligned face crop; skips detection
+    # GET  /health             batching counters
+    engine = None
+    batcher = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(200, {"status": "ok", "model": MODEL_NAME, "detector": DETECTOR,
+                              "threshold": self.engine.threshold, "gallery_size": len(self.engine.gallery),
+                              "batches": self.batcher.batches, "faces": self.batcher.faces})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/recognize":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        try:
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            img = decode_image(data)
+            if parse_qs(url.query).get("crop", ["0"])[0] == "1":
+                future = self.batcher.submit(faces=[crop_to_face(img)])
+            else:
+                future = self.batcher.submit(image=img)
+            faces, identities = future.result()
+        except Exception as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        self._send_json(200, {"faces": [
+            {"box": [int(v) for v in (f["facial_area"]["x"], f["facial_area"]["y"],
+                                      f["facial_area"]["w"], f["facial_area"]["h"])],
+             "name": str(name), "distance": distance}
+            for f, (name, distance) in zip(faces, identities)
+        ]})
+
+    def log_message(self, format, *args):
+        pass  # keep the console for our own output
+
+
+def recognize_remote(img, crop=False, url=SERVICE_URL, timeout=30):
+    """Client helper: send an image path, BGR array or encoded bytes to a running service."""
+    if isinstance(img, np.ndarray):
+        data = cv2.imencode(".png", img)[1].tobytes()
+    elif isinstance(img, (bytes, bytearray)):
+        data = bytes(img)
+    else:
+        with open(img, "rb") as f:
+            data = f.read()
+
+    request = urllib.request.Request(
+        f"{url}/recognize" + ("?crop=1" if crop else ""),
+        data=data,
+        headers={"Content-Type": "application/octet-stream"},
+        method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())["faces"]
+
+
+def service_health(url=SERVICE_URL, timeout=1):
+    # /health payload of a running service, or None when nothing answers
+    try:
+        with urllib.request.urlopen(f"{url}/health", timeout=timeout) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError):
+        return None
+
+
+def service_available(url=SERVICE_URL, timeout=1):
+    return service_health(url, timeout) is not None
+
+
+if __name__ == "__main__":
+    from deepface import DeepFace
+    from face_gallery import FaceGallery
+    from face_pipeline import RecognitionEngine
+
+    parser = argparse.ArgumentParser(description="Long-running local recognition service with dynamic batching")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--store", help="Serve the gallery from a memory-mapped embedding store directory")
+    parser.add_argument("--known-dir", default=KNOWN_FACES_DIR, help="Gallery folder (ignored with --store)")
+    args = parser.parse_args()
+
+    print(f"📦 Loading {MODEL_NAME} and building the gallery...")
+    model = DeepFace.build_model(MODEL_NAME)
+    if args.store:
+        gallery = FaceGallery.from_store(args.store)
+    else:
+        gallery = FaceGallery.load_or_build(args.known_dir, model_name=MODEL_NAME, detector_backend=DETECTOR)
+
+    RecognitionHandler.engine = RecognitionEngine(gallery, model, DETECTOR, THRESHOLD)
+    RecognitionHandler.batcher = DynamicBatcher(RecognitionHandler.engine, args.window_ms, args.max_batch)
+
+    server = ThreadingHTTPServer((args.host, args.port), RecognitionHandler)
+    print(f"🚀 Recognition service on http://{args.host}:{args.port} ({len(gallery)} gallery embeddings)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
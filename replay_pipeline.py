@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import argparse
+import threading
+from deepface import DeepFace
+from face_gallery import FaceGallery
+from stage_metrics import StageMetrics
+from unknown_logger import UnknownLogWriter
+from video_pipeline import VirtualCamera
+from real_time_recognition import (KNOWN_FACES_DIR, MODEL_NAME, DETECTOR, ADAPTIVE_DETECTION, prepare_gallery,
+                                   create_engine, create_pipeline, draw_results, log_unknowns)
+
+# Configuration
+RESULTS_PATH = "output/replay_results.jsonl"
+SUMMARY_PATH = "output/replay_summary.json"
+REPLAY_LOG_DIR = "output/replay_unknowns"
+
+
+def replay(cap, engine, pace, results_path, unknown_logger=None, adaptive=ADAPTIVE_DETECTION):
+    """Feed a virtual camera through the live pipeline and record every result.
+
+    Consumes `results` the way the Tk render loop does (draw on a copy, log
+    unknowns), just without a window. Frames the adaptive scheduler skips are
+    delivered with the previous results carried forward (detected=False), as
+    the window would show them. With pace="max" the pipeline runs lossless, so
+    every frame is delivered and runs are repeatable.
+    """
+    metrics = StageMetrics(window=1_000_000)
+    pipeline, tracker = create_pipeline(cap, engine, metrics, live=False, lossless=(pace == "max"),
+                                        adaptive=adaptive, emit_skipped=True)
+    drainer = threading.Thread(target=pipeline.drain, daemon=True)
+
+    delivered = detected = 0
+    start = time.perf_counter()
+    pipeline.start()
+    drainer.start()
+    with open(results_path, "w") as f:
+        while True:
+            item = pipeline.results.get(timeout=0.1)
+            if item is None:
+                if pipeline.results.closed:
+                    break
+                continue
+            with metrics.time("drawing"):
+                display_frame = item["frame"].copy()
+                draw_results(display_frame, item["results"])
+            if unknown_logger is not None:
+                with metrics.time("logging"):
+                    log_unknowns(unknown_logger, item["frame"], item["results"])
+            delivered += 1
+            detected += item["detected"]
+            f.write(json.dumps({
+                "seq": item["seq"],
+                "detected": item["detected"],
+                "latency_ms": round((item["recognized_at"] - item["captured_at"]) * 1000.0, 2),
+                "faces": [{"box": [int(v) for v in face["box"]], "name": str(face["name"]),
+                           "distance": face["distance"], "track_id": face.get("track_id")}
+                          for face in item["results"]]
+            }) + "\n")
+    elapsed = time.perf_counter() - start
+    pipeline.stop()
+
+    return {"source": getattr(cap, "source", None), "pace": pace, "source_fps": cap.fps,
+            "adaptive": adaptive, "frames_read": pipeline.grabber.seq, "frames_delivered": delivered,
+            "frames_detected": detected,
+            "wall_time_s": round(elapsed, 3), "throughput_fps": round(delivered / elapsed, 2) if elapsed else 0.0,
+            "dropped": pipeline.dropped(), "embed_ratio": round(tracker.embed_ratio(), 4),
+            "stages": metrics.snapshot()["stages"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a video file or frame folder through the live pipeline, headless")
+    parser.add_argument("source", help="Video file or folder of frames")
+    parser.add_argument("--pace", choices=["realtime", "max"], default="realtime",
+                        help="realtime releases frames at the source fps (live drop behaviour); "
+                             "max processes every frame as fast as possible")
+    parser.add_argument("--fps", type=float, default=None, help="Frame rate for folders (default 30) or to override a video's")
+    parser.add_argument("--results", default=RESULTS_PATH, help="Per-frame JSONL output")
+    parser.add_argument("--summary", default=SUMMARY_PATH)
+    parser.add_argument("--log-unknowns", action="store_true", help=f"also write unknown crops to {REPLAY_LOG_DIR}")
+    parser.add_argument("--no-adaptive", action="store_true", help="run the detector on every frame")
+    args = parser.parse_args()
+
+    cap = VirtualCamera(args.source, fps=args.fps, realtime=(args.pace == "realtime"))
+    if not cap.isOpened():
+        print(f"❌ Could not open source: {args.source}")
+        raise SystemExit(1)
+
+    print(f"📦 Loading {MODEL_NAME} and the gallery...")
+    model = DeepFace.build_model(MODEL_NAME)
+    gallery = prepare_gallery(FaceGallery.load_or_build(KNOWN_FACES_DIR, model_name=MODEL_NAME,
+                                                        detector_backend=DETECTOR))
+    engine = create_engine(model, gallery)
+
+    unknown_logger = None
+    if args.log_unknowns:
+        unknown_logger = UnknownLogWriter(REPLAY_LOG_DIR)
+        unknown_logger.start()
+
+    os.makedirs(os.path.dirname(args.results) or ".", exist_ok=True)
+    print(f"🎬 Replaying {args.source} ({args.pace} pace, {cap.fps:.1f} fps source)...")
+    summary = replay(cap, engine, args.pace, args.results, unknown_logger, adaptive=not args.no_adaptive)
+    if unknown_logger is not None:
+        unknown_logger.stop()
+        unknown_logger.join()
+
+    with open(args.summary, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    pipeline_stats = summary["stages"].get("pipeline", {})
+    print(f"\n📐 {summary['frames_delivered']}/{summary['frames_read']} frames delivered "
+          f"({summary['frames_detected']} detected) in {summary['wall_time_s']:.2f}s "
+          f"-> {summary['throughput_fps']:.2f} fps")
+    print(f"⏱️ Capture-to-result latency p50 {pipeline_stats.get('p50_ms', 0):.1f}ms, "
+          f"p95 {pipeline_stats.get('p95_ms', 0):.1f}ms, p99 {pipeline_stats.get('p99_ms', 0):.1f}ms")
+    print(f"🧮 Embedded {summary['embed_ratio'] * 100:.1f}% of tracked faces, dropped {summary['dropped']}")
+    print(f"✅ Per-frame results saved to: {args.results}, summary to: {args.summary}")
@@ -0,0 +1,135 @@
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # optional: only needed for the "hnsw" backend
+    hnswlib = None
+
+
+def top_k(sims, k):
+    # (n, m) similarities -> (indices, similarities) of the k best per row, best first
+    k = min(k, sims.shape[1])
+    if k == 0:
+        return np.zeros((sims.shape[0], 0), dtype=np.int64), np.zeros((sims.shape[0], 0), dtype=np.float32)
+    if k == 1:
+        idx = np.argmax(sims, axis=1)[:, None]
+    else:
+        idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sims, idx, axis=1), axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+    return idx, np.take_along_axis(sims, idx, axis=1)
+
+
+def spherical_kmeans(x, k, iterations=10, seed=0):
+    # k-means on the unit sphere (cosine); returns (unit centroids, assignment of x)
+    rng = np.random.default_rng(seed)
+    k = max(1, min(k, len(x)))
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(x @ centroids.T, axis=1)
+        for c in range(k):
+            members = x[assign == c]
+            centroids[c] = members.mean(axis=0) if len(members) else x[rng.integers(len(x))]
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-10)
+    assign = np.argmax(x @ centroids.T, axis=1)
+    return np.ascontiguousarray(centroids, dtype=np.float32), assign
+
+
+class ExactSearch:
+    """Brute-force cosine search: one matrix product against every embedding."""
+
+    name = "exact"
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def search(self, queries, k=1):
+        idx, sims = top_k(queries @ self.embeddings.T, k)
+        return idx, 1.0 - sims
+
+
+class IVFSearch:
+    """Inverted-file index: spherical k-means into `nlist` cells, search the `nprobe` nearest.
+
+    Larger nprobe raises recall and cost; nprobe == nlist is exact search.
+    """
+
+    name = "ivf"
+
+    def __init__(self, embeddings, nlist=None, nprobe=8, iterations=10, train_size=256, seed=0):
+        self.embeddings = embeddings
+        n = len(embeddings)
+        self.nlist = max(1, min(nlist or int(np.sqrt(n)), n))
+        self.nprobe = nprobe
+        rng = np.random.default_rng(seed)
+
+        # Train the centroids on a sample, then assign every embedding
+        sample = embeddings[rng.choice(n, size=min(n, self.nlist * train_size), replace=False)]
+        self.centroids = spherical_kmeans(sample, self.nlist, iterations, seed)[0]
+
+        assign = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 65536):
+            assign[start:start + 65536] = np.argmax(embeddings[start:start + 65536] @ self.centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(self.nlist)]
+
+    def search(self, queries, k=1):
+        nprobe = min(self.nprobe, self.nlist)
+        cell_idx, _ = top_k(queries @ self.centroids.T, nprobe)
+
+        all_idx = np.full((len(queries), k), -1, dtype=np.int64)
+        all_dist = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for i, cells in enumerate(cell_idx):
+            candidates = np.concatenate([self.lists[c] for c in cells])
+            if not len(candidates):
+                continue
+            idx, sims = top_k(queries[i:i + 1] @ self.embeddings[candidates].T, k)
+            found = idx.shape[1]
+            all_idx[i, :found] = candidates[idx[0]]
+            all_dist[i, :found] = 1.0 - sims[0]
+        return all_idx, all_dist
+
+
+class HNSWSearch:
+    """Graph-based ANN through the optional hnswlib package.
+
+    M and ef_construction trade build time/memory for graph quality; ef is
+    the query-time recall/speed knob.
+    """
+
+    name = "hnsw"
+
+    def __init__(self, embeddings, M=16, ef_construction=200, ef=64):
+        if hnswlib is None:
+            raise ImportError("The 'hnsw' search backend needs hnswlib (pip install hnswlib)")
+        self.index = hnswlib.Index(space="ip", dim=embeddings.shape[1])
+        self.index.init_index(max_elements=len(embeddings), M=M, ef_construction=ef_construction)
+        self.index.add_items(embeddings, np.arange(len(embeddings)))
+        self.index.set_ef(ef)
+
+    def search(self, queries, k=1):
+        labels, distances = self.index.knn_query(queries, k=k)
+        # hnswlib's "ip" distance is already 1 - dot
+        return labels.astype(np.int64), distances.astype(np.float32)
+
+
+BACKENDS = {"exact": ExactSearch, "ivf": IVFSearch, "hnsw": HNSWSearch}
+
+
+def available_backends():
+    return [name for name in BACKENDS if name != "hnsw" or hnswlib is not None]
+
+
+def make_backend(name, embeddings, **params):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown search backend: {name} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name](embeddings, **params)
+
+
+def recall_at_k(backend, exact, queries, k=1):
+    """Fraction of the exact top-k neighbours that `backend` also returns."""
+    approx_idx, _ = backend.search(queries, k)
+    exact_idx, _ = exact.search(queries, k)
+    hits = sum(len(set(a) & set(e)) for a, e in zip(approx_idx.tolist(), exact_idx.tolist()))
+    return hits / float(exact_idx.size) if exact_idx.size else 1.0
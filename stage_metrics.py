@@ -0,0 +1,161 @@
+import os
+import json
+import threading
+import time
+from collections import deque, defaultdict
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+
+WINDOW = 300  # samples kept per stage for the rolling percentiles
+RATE_WINDOW = 5.0  # seconds over which fps counters are averaged
+QUANTILES = (50, 95, 99)
+
+
+class StageMetrics:
+    """Thread-safe rolling per-stage latencies and fps counters for the live loop."""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.totals = defaultdict(int)
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._events = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples[stage].append(seconds)
+            self.totals[stage] += 1
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def tick(self, counter):
+        # One event (e.g. a rendered or recognized frame) for the fps counters
+        now = time.time()
+        with self._lock:
+            events = self._events[counter]
+            events.append(now)
+            while events and now - events[0] > RATE_WINDOW:
+                events.popleft()
+
+    def fps(self, counter):
+        now = time.time()
+        with self._lock:
+            events = [t for t in self._events[counter] if now - t <= RATE_WINDOW]
+        if len(events) < 2:
+            return 0.0
+        return (len(events) - 1) / max(events[-1] - events[0], 1e-6)
+
+    def snapshot(self):
+        with self._lock:
+            samples = {stage: np.array(values) for stage, values in self._samples.items()}
+            counters = list(self._events)
+            totals = dict(self.totals)
+        stages = {}
+        for stage, values in samples.items():
+            if not len(values):
+                continue
+            ms = np.percentile(values * 1000.0, QUANTILES)
+            stages[stage] = {f"p{q}_ms": round(float(v), 2) for q, v in zip(QUANTILES, ms)}
+            stages[stage]["count"] = totals.get(stage, 0)
+        return {"time": time.time(), "stages": stages,
+                "fps": {counter: round(self.fps(counter), 2) for counter in counters}}
+
+    def to_prometheus(self):
+        snap = self.snapshot()
+        lines = ["# TYPE face_stage_latency_seconds summary"]
+        for stage, stats in snap["stages"].items():
+            for q in QUANTILES:
+                lines.append(f'face_stage_latency_seconds{{stage="{stage}",quantile="{q / 100}"}} '
+                             f'{stats[f"p{q}_ms"] / 1000.0:.6f}')
+            lines.append(f'face_stage_latency_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines.append("# TYPE face_fps gauge")
+        for counter, value in snap["fps"].items():
+            lines.append(f'face_fps{{counter="{counter}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def draw_overlay(self, frame, stages=None):
+        # Small text block in the top-left corner: fps then one p50/p95/p99 line per stage
+        snap = self.snapshot()
+        lines = [" ".join(f"{name} {value:.1f}fps" for name, value in snap["fps"].items())]
+        for stage, stats in snap["stages"].items():
+            if stages is None or stage in stages:
+                lines.append(f"{stage:<10} {stats['p50_ms']:6.1f} {stats['p95_ms']:6.1f} {stats['p99_ms']:6.1f} ms")
+        for i, line in enumerate(lines):
+            y = 20 + i * 18
+            cv2.putText(frame, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 3)
+            cv2.putText(frame, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+
+
+class NullMetrics:
+    """Stand-in used when a caller does not collect metrics."""
+
+    def record(self, stage, seconds):
+        pass
+
+    def time(self, stage):
+        return nullcontext()
+
+    def tick(self, counter):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = self.metrics.to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(self.metrics.snapshot()), "application/json"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(metrics, port, host="127.0.0.1"):
+    """Expose /metrics (Prometheus text) and /metrics.json on a background thread."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"metrics": metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class JsonMetricsDumper(threading.Thread):
+    """Appends a metrics snapshot as one JSON line to `path` every `interval` seconds."""
+
+    def __init__(self, metrics, path, interval=10.0):
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            with open(self.path, "a") as f:
+                f.write(json.dumps(self.metrics.snapshot()) + "\n")
+
+    def stop(self):
+        self._stop_event.set()
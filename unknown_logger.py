@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import cv2
+from video_pipeline import DropQueue, DROP_NEWEST
+
+UNKNOWN_LOG_DIR = "unknown_logs"
+LOG_FILE_NAME = "unknown_log.txt"
+CROP_MARGIN = 0.2  # extra context around the face box, as a fraction of its size
+MAX_TRACKED_IDS = 1024  # logged track ids remembered; the least recently seen are forgotten first
+UNTRACKED_INTERVAL = 3.0  # seconds between logs of faces without a track id
+
+
+def crop_with_margin(frame, box, margin=CROP_MARGIN):
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    x0, y0 = max(0, x - dx), max(0, y - dy)
+    x1, y1 = min(frame.shape[1], x + w + dx), min(frame.shape[0], y + h + dy)
+    return frame[y0:y1, x0:x1].copy()
+
+
+class UnknownLogWriter(threading.Thread):
+    """Writes unknown-face crops and log lines off the recognition/render path.
+
+    submit() never blocks: when the bounded queue is full the new entry is
+    dropped and counted. Log lines are appended in batches, and each track is
+    logged once; faces without a track keep the old fixed 3-second throttle.
+    Lines keep the format see_unknowns.py parses.
+    """
+
+    def __init__(self, log_dir=UNKNOWN_LOG_DIR, max_queue=64, flush_interval=1.0):
+        super().__init__(daemon=True)
+        self.log_dir = log_dir
+        self.log_path = os.path.join(log_dir, LOG_FILE_NAME)
+        self.flush_interval = flush_interval
+        self.queue = DropQueue(maxsize=max_queue, policy=DROP_NEWEST)
+        self.written = 0
+        self.running = True
+        self._logged_tracks = OrderedDict()  # bounded LRU, track ids only grow
+        self._last_untracked = 0.0
+        self._reported_drops = 0
+
+    @property
+    def dropped(self):
+        return self.queue.dropped
+
+    def should_log(self, track_id):
+        # Per-track de-duplication; untracked faces fall back to a time throttle
+        if track_id is None:
+            now = time.time()
+            if now - self._last_untracked < UNTRACKED_INTERVAL:
+                return False
+            self._last_untracked = now
+            return True
+        if track_id in self._logged_tracks:
+            self._logged_tracks.move_to_end(track_id)
+            return False
+        self._logged_tracks[track_id] = True
+        if len(self._logged_tracks) > MAX_TRACKED_IDS:
+            # Oldest ids belong to tracks the tracker has long dropped
+            self._logged_tracks.popitem(last=False)
+        return True
+
+    def submit(self, face_crop, track_id=None, metadata=None):
+        entry = {"time": time.time(), "crop": face_crop, "track_id": track_id, "metadata": metadata or {}}
+        accepted = self.queue.put(entry)
+        if not accepted:
+            # Dropped under backpressure: let the face be logged on a later frame
+            if track_id is None:
+                self._last_untracked = 0.0
+            else:
+                self._logged_tracks.pop(track_id, None)
+        return accepted
+
+    def run(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        while self.running or len(self.queue):
+            lines = []
+            deadline = time.time() + self.flush_interval
+            while time.time() < deadline:
+                entry = self.queue.get(timeout=max(0.0, deadline - time.time()))
+                if entry is None:
+                    break
+                line = self._write_image(entry)
+                if line:
+                    lines.append(line)
+            self._flush(lines)
+            self._report_drops()
+
+    def _write_image(self, entry):
+        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime(entry["time"]))
+        suffix = f"_t{entry['track_id']}" if entry["track_id"] is not None else f"_{int(entry['time'] * 1000) % 1000:03d}"
+        image_path = os.path.join(self.log_dir, f"unknown_{timestamp}{suffix}.jpg")
+        try:
+            # imwrite reports most failures (bad path, empty crop, no encoder) by returning False
+            if not cv2.imwrite(image_path, entry["crop"]):
+                raise OSError(f"could not write {image_path}")
+        except Exception as e:
+            print(f"⚠️ Could not save unknown face: {e}")
+            return None
+
+        self.written += 1
+        line = f"{timestamp} - Unknown detected - saved to {image_path}"
+        details = {"track": entry["track_id"], **entry["metadata"]}
+        extras = ", ".join(f"{k}={v}" for k, v in details.items() if v is not None)
+        return line + (f" - {extras}" if extras else "")
+
+    def _flush(self, lines):
+        if not lines:
+            return
+        with open(self.log_path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def _report_drops(self):
+        if self.dropped > self._reported_drops:
+            print(f"⚠️ Unknown logger dropped {self.dropped - self._reported_drops} entries (queue full)")
+            self._reported_drops = self.dropped
+
+    def stop(self):
+        self.running = False
+        self.queue.close()
@@ -1,81 +1,195 @@
+import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from sklearn.datasets import fetch_lfw_pairs
 from deepface import DeepFace
+from embedding_cache import shared_cache, cache_key, content_hash
+from face_gallery import l2_normalize
+from face_pipeline import detect_faces, embed_faces
 from sklearn.metrics import accuracy_score, confusion_matrix, roc_curve, auc
 import matplotlib.pyplot as plt
 import seaborn as sns
 import time
 
-# Load LFW test set (1000 pairs: 500 same, 500 different)
-print("📦 Downloading LFW test pairs (1,000 pairs: 500 same, 500 different)...")
-lfw = fetch_lfw_pairs(subset="test", color=True, resize=1.0, funneled=True)
-images = lfw.pairs
-labels = lfw.target  # 1 = same person, 0 = different
+# Configuration
+MODEL_NAME = "VGG-Face"
+DETECTOR = "mtcnn"
+VERIFY_THRESHOLD = 0.68  # DeepFace's cosine threshold for VGG-Face
+NUM_WORKERS = os.cpu_count() or 1  # detection processes in batched mode
+BATCH_SIZE = 64  # faces per embedding call in batched mode
 
-print("🚀 Starting verification with DeepFace...\n")
 
-predictions = []
-distances = []
-probas = []
+def embed(img, cache=None):
+    # VGG-Face embedding of the first face, cached by pixel content; None when no face is found
+    def compute():
+        try:
+            reps = DeepFace.represent(img_path=img, model_name=MODEL_NAME,
+                                      detector_backend=DETECTOR, enforce_detection=True)
+        except ValueError:
+            return None  # no face detected - cached too, the result will not change
+        return reps[0]["embedding"]
+    if cache is None:
+        embedding = compute()
+        return None if embedding is None else np.asarray(embedding, dtype=np.float32)
+    return cache.get_or_compute(img, MODEL_NAME, DETECTOR, compute)
 
-start_time = time.time()
 
-for i, (img1, img2) in enumerate(images):
-    img1 = (img1 * 255).astype("uint8")
-    img2 = (img2 * 255).astype("uint8")
+def cosine_distance(a, b):
+    return 1 - float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
 
-    try:
-        result = DeepFace.verify(
-            img1_path=img1,
-            img2_path=img2,
-            model_name="VGG-Face",
-            detector_backend="mtcnn",
-            enforce_detection=True,
-            silent=True
-        )
-        predicted = int(result["verified"])
-        distance = result["distance"]
-        score = 1 - distance  # For ROC: similarity score
 
+def detect_first_face(img):
+    # Runs in a detection worker; each process builds its own detector once
+    try:
+        faces = detect_faces(img, DETECTOR)
     except Exception as e:
-        predicted = 0
-        distance = None
-        score = 0  # Treat as very dissimilar
-
-    predictions.append(predicted)
-    distances.append(distance)
-    probas.append(score)
-
-    print(f"[{i+1:>4}/{len(images)}] ✅ GT: {labels[i]} | Pred: {predicted} | Dist: {distance}")
-
-end_time = time.time()
-
-# Accuracy
-accuracy = accuracy_score(labels, predictions)
-print(f"\n✅ DeepFace (VGG-Face) manual verification accuracy on LFW: {accuracy * 100:.2f}%")
-print(f"🕒 Total time: {int(end_time - start_time)} seconds")
-
-# Confusion Matrix
-cm = confusion_matrix(labels, predictions)
-plt.figure(figsize=(6, 5))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", xticklabels=["Different", "Same"], yticklabels=["Different", "Same"])
-plt.xlabel("Predicted")
-plt.ylabel("Actual")
-plt.title("Confusion Matrix")
-plt.show()
-
-# ROC Curve
-fpr, tpr, thresholds = roc_curve(labels, probas)
-roc_auc = auc(fpr, tpr)
-
-plt.figure(figsize=(7, 6))
-plt.plot(fpr, tpr, color='darkorange', lw=2, label=f"ROC curve (AUC = {roc_auc:.2f})")
-plt.plot([0, 1], [0, 1], color='gray', linestyle='--')
-plt.xlim([0.0, 1.0])
-plt.ylim([0.0, 1.05])
-plt.xlabel("False Positive Rate")
-plt.ylabel("True Positive Rate")
-plt.title("Receiver Operating Characteristic (ROC) Curve")
-plt.legend(loc="lower right")
-plt.grid(True)
-plt.show()
+        print(f"⚠️ Detection failed: {e}")
+        return False  # unlike "no face" (None), failures are not cached
+    return faces[0]["face"] if faces else None
+
+
+def verify_sequential(pairs, cache=None):
+    # Pair by pair: both images are detected and embedded for every pair they appear in
+    distances = []
+    for img1, img2 in pairs:
+        try:
+            emb1, emb2 = embed(img1, cache), embed(img2, cache)
+            distances.append(None if emb1 is None or emb2 is None else cosine_distance(emb1, emb2))
+        except Exception:
+            distances.append(None)
+    return distances, 2 * len(pairs)
+
+
+def verify_batched(pairs, cache=None, num_workers=NUM_WORKERS, batch_size=BATCH_SIZE):
+    """Unique images -> parallel detection -> batched embedding -> one vectorized distance pass."""
+    # 1. Each distinct image once, however many pairs it appears in
+    index_of, unique = {}, []
+    pair_index = np.empty((len(pairs), 2), dtype=np.int64)
+    for i, pair in enumerate(pairs):
+        for j, img in enumerate(pair):
+            digest = content_hash(img)
+            if digest not in index_of:
+                index_of[digest] = len(unique)
+                unique.append(img)
+            pair_index[i, j] = index_of[digest]
+
+    embeddings = [None] * len(unique)
+    todo = []
+    for u, img in enumerate(unique):
+        cached = cache.get(cache_key(img, MODEL_NAME, DETECTOR)) if cache is not None else None
+        if cached is None:
+            todo.append(u)
+        elif len(cached):
+            embeddings[u] = cached
+
+    if todo:
+        # 2. MTCNN over a process pool (spawned, so TensorFlow is never forked)
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            faces = list(pool.map(detect_first_face, [unique[u] for u in todo], chunksize=8))
+
+        # 3. Batched embedding of every detected face
+        model = DeepFace.build_model(MODEL_NAME)
+        found = [(u, face) for u, face in zip(todo, faces) if face is not None and face is not False]
+        for start in range(0, len(found), batch_size):
+            batch = found[start:start + batch_size]
+            for (u, _), embedding in zip(batch, embed_faces([face for _, face in batch], model)):
+                embeddings[u] = embedding
+                if cache is not None:
+                    cache.put(cache_key(unique[u], MODEL_NAME, DETECTOR), embedding)
+        if cache is not None:
+            for u, face in zip(todo, faces):
+                if face is None:
+                    cache.put(cache_key(unique[u], MODEL_NAME, DETECTOR), None)  # no face, remember it
+
+    # 4. All pair distances at once
+    valid = np.array([e is not None for e in embeddings], dtype=bool)
+    if not valid.any():
+        return [None] * len(pairs), len(unique)
+    dim = len(next(e for e in embeddings if e is not None))
+    matrix = l2_normalize(np.stack([e if e is not None else np.zeros(dim) for e in embeddings]))
+    pair_distances = 1.0 - np.sum(matrix[pair_index[:, 0]] * matrix[pair_index[:, 1]], axis=1)
+    ok = valid[pair_index[:, 0]] & valid[pair_index[:, 1]]
+    return [float(d) if o else None for d, o in zip(pair_distances, ok)], len(unique)
+
+
+def timed(name, run, pairs, **kwargs):
+    start_time = time.time()
+    distances, processed = run(pairs, **kwargs)
+    elapsed = time.time() - start_time
+    print(f"🕒 {name}: {elapsed:.1f}s wall time, {processed} images processed, "
+          f"{2 * len(pairs) / elapsed:.1f} pair images/s")
+    return distances, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VGG-Face verification accuracy on LFW test pairs")
+    parser.add_argument("--mode", choices=["batched", "sequential", "compare"], default="batched",
+                        help="compare times both paths without the embedding cache")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--pairs", type=int, default=None, help="only use the first N pairs")
+    args = parser.parse_args()
+
+    # Load LFW test set (1000 pairs: 500 same, 500 different)
+    print("📦 Downloading LFW test pairs (1,000 pairs: 500 same, 500 different)...")
+    lfw = fetch_lfw_pairs(subset="test", color=True, resize=1.0, funneled=True)
+    images = lfw.pairs[:args.pairs]
+    labels = lfw.target[:args.pairs]  # 1 = same person, 0 = different
+    pairs = [((img1 * 255).astype("uint8"), (img2 * 255).astype("uint8")) for img1, img2 in images]
+
+    print(f"🚀 Starting {args.mode} verification with DeepFace...\n")
+
+    if args.mode == "compare":
+        _, sequential_time = timed("Sequential", verify_sequential, pairs)
+        distances, batched_time = timed("Batched", verify_batched, pairs, num_workers=args.workers,
+                                        batch_size=args.batch_size)
+        print(f"⚡ Speedup: {sequential_time / batched_time:.1f}x")
+    elif args.mode == "sequential":
+        distances, _ = timed("Sequential", verify_sequential, pairs, cache=shared_cache())
+    else:
+        distances, _ = timed("Batched", verify_batched, pairs, cache=shared_cache(), num_workers=args.workers,
+                             batch_size=args.batch_size)
+
+    predictions = []
+    probas = []
+    for i, distance in enumerate(distances):
+        if distance is None:
+            predicted = 0
+            score = 0  # Treat as very dissimilar
+        else:
+            predicted = int(distance <= VERIFY_THRESHOLD)
+            score = 1 - distance  # For ROC: similarity score
+        predictions.append(predicted)
+        probas.append(score)
+        print(f"[{i+1:>4}/{len(pairs)}] ✅ GT: {labels[i]} | Pred: {predicted} | Dist: {distance}")
+
+    # Accuracy
+    accuracy = accuracy_score(labels, predictions)
+    print(f"\n✅ DeepFace (VGG-Face) manual verification accuracy on LFW: {accuracy * 100:.2f}%")
+
+    # Confusion Matrix
+    cm = confusion_matrix(labels, predictions)
+    plt.figure(figsize=(6, 5))
+    sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", xticklabels=["Different", "Same"], yticklabels=["Different", "Same"])
+    plt.xlabel("Predicted")
+    plt.ylabel("Actual")
+    plt.title("Confusion Matrix")
+    plt.show()
+
+    # ROC Curve
+    fpr, tpr, thresholds = roc_curve(labels, probas)
+    roc_auc = auc(fpr, tpr)
+
+    plt.figure(figsize=(7, 6))
+    plt.plot(fpr, tpr, color='darkorange', lw=2, label=f"ROC curve (AUC = {roc_auc:.2f})")
+    plt.plot([0, 1], [0, 1], color='gray', linestyle='--')
+    plt.xlim([0.0, 1.0])
+    plt.ylim([0.0, 1.05])
+    plt.xlabel("False Positive Rate")
+    plt.ylabel("True Positive Rate")
+    plt.title("Receiver Operating Characteristic (ROC) Curve")
+    plt.legend(loc="lower right")
+    plt.grid(True)
+    plt.show()
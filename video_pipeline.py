@@ -0,0 +1,322 @@
+import os
+import cv2
+import threading
+import time
+from collections import deque
+from stage_metrics import StageMetrics, NULL_METRICS
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"  # lossless: the producer waits for space (offline replay)
+FRAME_EXTENSIONS = ("jpg", "jpeg", "png", "bmp")
+
+
+class DropQueue:
+    """Bounded queue that never blocks the producer: when full it drops per `policy`.
+
+    The BLOCK policy is the exception: put() waits for space instead of dropping,
+    so a replayed source is processed frame by frame.
+    """
+
+    def __init__(self, maxsize=1, policy=DROP_OLDEST):
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def put(self, item):
+        # Returns False when an item (old or new, depending on policy) was dropped
+        with self._cond:
+            if self.policy == BLOCK:
+                while len(self._items) >= self.maxsize and not self.closed:
+                    self._cond.wait()
+            if self.closed:
+                return False
+            accepted = True
+            if len(self._items) >= self.maxsize:
+                self.dropped += 1
+                if self.policy == DROP_NEWEST:
+                    return False
+                self._items.popleft()
+                accepted = False
+            self._items.append(item)
+            self._cond.notify_all()
+            return accepted
+
+    def get(self, timeout=None):
+        # Returns None on timeout or once the queue is closed and drained
+        with self._cond:
+            if not self._items and not self.closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._pop()
+
+    def get_nowait(self):
+        with self._cond:
+            return self._pop() if self._items else None
+
+    def _pop(self):
+        item = self._items.popleft()
+        if self.policy == BLOCK:
+            self._cond.notify_all()  # wake a producer waiting for space
+        return item
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+def parse_source(source):
+    # "0" -> webcam index 0; anything else is a video file or stream URL
+    return int(source) if str(source).isdigit() else source
+
+
+def is_live_source(source):
+    source = parse_source(source)
+    return isinstance(source, int) or "://" in source
+
+
+def open_capture(source):
+    # Files (and frame folders) are paced at their own fps, like a camera; read
+    # unpaced they overrun the latest-frame queue and drop a random share of frames
+    if is_live_source(source):
+        cap = cv2.VideoCapture(parse_source(source))
+    else:
+        cap = VirtualCamera(source, realtime=True)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open source: {source}")
+    return cap
+
+
+class VirtualCamera:
+    """cv2.VideoCapture stand-in that replays a video file or a folder of frames.
+
+    With realtime=True frames are released at the source frame rate, like a
+    camera would deliver them; otherwise as fast as they are read.
+    """
+
+    def __init__(self, source, fps=None, realtime=True):
+        self.source = source
+        self.realtime = realtime
+        self.frames = None
+        self.cap = None
+        if os.path.isdir(source):
+            self.frames = sorted(os.path.join(source, name) for name in os.listdir(source)
+                                 if name.lower().rsplit(".", 1)[-1] in FRAME_EXTENSIONS)
+            self.fps = fps or 30.0
+        else:
+            self.cap = cv2.VideoCapture(source)
+            self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.index = 0
+        self.started_at = None
+
+    def isOpened(self):
+        return bool(self.frames) if self.cap is None else self.cap.isOpened()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT and self.cap is None:
+            return len(self.frames)
+        return self.cap.get(prop) if self.cap is not None else 0
+
+    def read(self):
+        if self.cap is not None:
+            ret, frame = self.cap.read()
+        elif self.index < len(self.frames):
+            frame = cv2.imread(self.frames[self.index])
+            ret = frame is not None
+        else:
+            ret, frame = False, None
+        if not ret:
+            return False, None
+
+        if self.realtime:
+            if self.started_at is None:
+                self.started_at = time.perf_counter()
+            delay = self.started_at + self.index / self.fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.index += 1
+        return True, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+class FrameGrabber(threading.Thread):
+    """Capture stage: reads the source as fast as it delivers, always keeping the latest frame.
+
+    Live sources are retried on read failures; finite ones (video files) end
+    the grabber at EOF and set `finished`.
+    """
+
+    def __init__(self, cap, out_queue, live=True, metrics=NULL_METRICS):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.metrics = metrics
+        self.out_queue = out_queue
+        self.live = live
+        self.finished = False
+        self.running = True
+        self.seq = 0
+        self._latest = None
+        self._lock = threading.Lock()
+
+    def latest(self):
+        with self._lock:
+            return self._latest
+
+    def run(self):
+        while self.running:
+            with self.metrics.time("capture"):
+                ret, frame = self.cap.read()
+            if not ret:
+                if not self.live:
+                    break
+                time.sleep(0.005)
+                continue
+            self.seq += 1
+            self.metrics.tick("captured")
+            item = {"seq": self.seq, "captured_at": time.time(), "frame": frame}
+            with self._lock:
+                self._latest = item
+            self.out_queue.put(item)
+        self.cap.release()
+        self.finished = True
+
+    def stop(self):
+        self.running = False
+
+
+class StageWorker(threading.Thread):
+    """Pulls items from in_queue, applies `fn` and pushes the result to out_queue."""
+
+    def __init__(self, fn, in_queue, out_queue):
+        super().__init__(daemon=True)
+        self.fn = fn
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.running = True
+
+    def run(self):
+        while self.running:
+            item = self.in_queue.get(timeout=0.1)
+            if item is None:
+                if self.in_queue.closed:
+                    break
+                continue
+            try:
+                result = self.fn(item)
+                # A stage returns None to drop the item (e.g. a frame skipped by detection)
+                if result is not None:
+                    self.out_queue.put(result)
+            except Exception as e:
+                print(f"⚠️ Pipeline stage error: {e}")
+
+    def stop(self):
+        self.running = False
+
+
+class RecognitionPipeline:
+    """capture -> detect -> recognize, linked by bounded drop queues.
+
+    The render stage is whoever consumes `results` (the Tk window polls it on
+    the main thread), so a slow recognition never stalls capture or display.
+    Frames the scheduler skips are dropped, unless `emit_skipped` is set: then
+    they come out with the previous frame's results and detected=False.
+    """
+
+    def __init__(self, cap, engine, queue_size=1, drop_policy=DROP_OLDEST,
+                 detect_workers=1, recognize_workers=1, tracker=None, scheduler=None, metrics=None,
+                 live=True, lossless=False, emit_skipped=False):
+        self.engine = engine
+        self.emit_skipped = emit_skipped
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.tracker = tracker
+        self.scheduler = scheduler
+        # The capture queue always keeps only the newest frame, unless a
+        # replay asks for every frame to go through (lossless)
+        self.frames = DropQueue(maxsize=1, policy=BLOCK if lossless else DROP_OLDEST)
+        self.detections = DropQueue(maxsize=queue_size, policy=BLOCK if lossless else drop_policy)
+        self.results = DropQueue(maxsize=queue_size, policy=BLOCK if lossless else drop_policy)
+
+        self.grabber = FrameGrabber(cap, self.frames, live=live, metrics=self.metrics)
+        self.detect_workers = [StageWorker(self._detect, self.frames, self.detections)
+                               for _ in range(detect_workers)]
+        self.recognize_workers = [StageWorker(self._recognize, self.detections, self.results)
+                                  for _ in range(recognize_workers)]
+        self.workers = self.detect_workers + self.recognize_workers
+        self._last_detected_seq = 0
+        self._last_results = []
+
+    def _detect(self, item):
+        if self.scheduler is not None and not self.scheduler.should_detect():
+            if not self.emit_skipped:
+                return None
+            item["faces"] = None
+            return item
+        # Frames since the previous detector pass (skipped or dropped ones included)
+        item["frames"] = max(1, item["seq"] - self._last_detected_seq)
+        self._last_detected_seq = item["seq"]
+        item["faces"] = self.engine.detect(item["frame"], metrics=self.metrics)
+        if self.scheduler is not None:
+            self.scheduler.observe(item["faces"])
+        return item
+
+    def _recognize(self, item):
+        faces = item.pop("faces")
+        item["detected"] = faces is not None
+        if item["detected"]:
+            item["results"] = self.engine.recognize(faces, tracker=self.tracker, metrics=self.metrics,
+                                                    frames=item.pop("frames"))
+            self._last_results = item["results"]
+            self.metrics.tick("recognized")
+        else:
+            # Skipped by the scheduler: carry the last results forward, as the display does
+            item["results"] = self._last_results
+        item["recognized_at"] = time.time()
+        self.metrics.record("pipeline", item["recognized_at"] - item["captured_at"])
+        return item
+
+    def latest_frame(self):
+        item = self.grabber.latest()
+        return None if item is None else item["frame"]
+
+    def start(self):
+        self.grabber.start()
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        self.grabber.stop()
+        for worker in self.workers:
+            worker.stop()
+        for q in (self.frames, self.detections, self.results):
+            q.close()
+
+    def drain(self):
+        # Finite sources: wait for EOF, then close and flush each stage in order,
+        # so every in-flight frame reaches `results` before it is closed
+        self.grabber.join()
+        for q, workers in ((self.frames, self.detect_workers), (self.detections, self.recognize_workers)):
+            q.close()
+            for worker in workers:
+                worker.join()
+        self.results.close()
+
+    def dropped(self):
+        return {"frames": self.frames.dropped,
+                "detections": self.detections.dropped,
+                "results": self.results.dropped}